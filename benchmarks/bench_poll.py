@@ -0,0 +1,125 @@
+"""
+Poll cycle benchmark of SAJeSolarMeterData against the local mock portal.
+
+    python benchmarks/bench_poll.py --mode saj_sec --cycles 200 --latency 0.05
+
+Reports portal fetches per second, p50/p99 cycle latency and, with --trace-alloc,
+the peak memory allocated per cycle. --cold disables the topology cache and the
+slow refresh tier so every cycle does the full discovery.
+"""
+
+import argparse
+import asyncio
+import datetime
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import aiohttp
+from aiohttp.test_utils import TestServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from custom_components.saj_esolar.sensor import (  # noqa: E402
+    DEFAULT_SLOW_SCAN_INTERVAL,
+    DEFAULT_TOPOLOGY_TTL,
+    EsolarProvider,
+    SAJeSolarMeterData,
+)
+from custom_components.saj_esolar.session import EsolarSession  # noqa: E402
+from custom_components.saj_esolar.topology import TopologyCache  # noqa: E402
+from homeassistant.helpers.update_coordinator import UpdateFailed  # noqa: E402
+
+from mock_portal import MODES, MockPortal  # noqa: E402
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+async def benchmark(args):
+    portal = MockPortal(
+        args.mode,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        expire_every=args.expire_every,
+    )
+    server = TestServer(portal.application())
+    await server.start_server()
+    provider = EsolarProvider(f"{server.host}:{server.port}", "saj", "http")
+
+    try:
+        # the default cookie jar ignores cookies of IP address hosts like the mock portal
+        async with aiohttp.ClientSession(cookie_jar=aiohttp.CookieJar(unsafe=True)) as session:
+            esolar = EsolarSession(session, provider, "bench@example.com", "secret")
+            topology = TopologyCache(datetime.timedelta(0) if args.cold else DEFAULT_TOPOLOGY_TTL)
+            slow_interval = datetime.timedelta(0) if args.cold else DEFAULT_SLOW_SCAN_INTERVAL
+            data = SAJeSolarMeterData(esolar, args.mode, 0, provider, topology, slow_interval)
+
+            # warm up: login and discovery, retried past injected errors
+            for attempt in range(10):
+                try:
+                    await data.async_update()
+                    break
+                except UpdateFailed:
+                    if attempt == 9:
+                        raise
+            portal.requests.clear()
+
+            latencies = []
+            peaks = []
+            failures = 0
+            if args.trace_alloc:
+                tracemalloc.start()
+            started = time.perf_counter()
+            for _ in range(args.cycles):
+                if args.trace_alloc:
+                    tracemalloc.reset_peak()
+                    current = tracemalloc.get_traced_memory()[0]
+                cycle = time.perf_counter()
+                try:
+                    await data.async_update()
+                except UpdateFailed:
+                    failures += 1
+                latencies.append(time.perf_counter() - cycle)
+                if args.trace_alloc:
+                    peaks.append(tracemalloc.get_traced_memory()[1] - current)
+            elapsed = time.perf_counter() - started
+            if args.trace_alloc:
+                tracemalloc.stop()
+    finally:
+        await server.close()
+
+    fetches = sum(portal.requests.values())
+    print(f"mode {args.mode}, {args.cycles} cycles, latency {args.latency}s, {'cold' if args.cold else 'warm'}")
+    print(f"  fetches/s        {fetches / elapsed:10.1f}  ({fetches / args.cycles:.1f} per cycle)")
+    print(f"  cycles/s         {args.cycles / elapsed:10.1f}")
+    print(f"  p50 cycle        {percentile(latencies, 50) * 1000:10.2f} ms")
+    print(f"  p99 cycle        {percentile(latencies, 99) * 1000:10.2f} ms")
+    print(f"  failed cycles    {failures:10d}")
+    print(f"  logins           {portal.logins:10d}")
+    if peaks:
+        print(f"  peak alloc/cycle {statistics.median(peaks) / 1024:10.1f} KiB")
+    for name, count in sorted(portal.requests.items()):
+        print(f"    {name:32s} {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=list(MODES), default="None")
+    parser.add_argument("--cycles", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every portal response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra latency, up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="chance a portal call answers with a 502")
+    parser.add_argument("--expire-every", type=int, default=0, help="expire the session every n portal calls")
+    parser.add_argument("--cold", action="store_true", help="no topology cache and no slow tier")
+    parser.add_argument("--trace-alloc", action="store_true", help="measure the memory allocated per cycle")
+    asyncio.run(benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Local stand-in for the Modbus-TCP interface of an SAJ H1, serving holding registers.
+Used to exercise the local data source without an inverter, the registers hold the
+live values of the h1 fixtures and can be changed while the server runs.
+
+    python benchmarks/mock_modbus.py --port 5020
+"""
+
+import argparse
+import asyncio
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from custom_components.saj_esolar.modbus import READ_HOLDING_REGISTERS, REGISTER_TYPES  # noqa: E402
+
+# Register address -> word, the values of the h1 fixtures at the H1 register map
+H1_WORDS = {
+    0x4098: 1834,
+    0x40A1: 1834,
+    0x40A3: 682,
+    0x40A5: (-640) & 0xFFFF,
+    0x406B: 7600,
+    0x406D: (-1240) & 0xFFFF,
+    0x40A9: 512,
+    0x40AD: 682,
+}
+
+# Modbus exception code of a read of registers the device doesn't have
+ILLEGAL_DATA_ADDRESS = 2
+
+
+class MockModbus(object):
+    """asyncio Modbus-TCP server answering reads of holding registers.
+
+    Registers that are not set read as 0, unless strict, then the read fails with
+    an illegal data address exception like a device without them does.
+    latency: seconds added to every answer
+    """
+
+    def __init__(self, words=None, latency=0.0, strict=False):
+        self.words = dict(H1_WORDS if words is None else words)
+        self.latency = latency
+        self.strict = strict
+        self.requests = 0
+
+    def set(self, address, value, type="int16"):
+        """Store a value at a register, in the words of its register type."""
+        count, fmt = REGISTER_TYPES[type]
+        for offset, word in enumerate(struct.unpack(f">{count}H", struct.pack(fmt, value))):
+            self.words[address + offset] = word
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                transaction, protocol, length, unit = struct.unpack(">HHHB", await reader.readexactly(7))
+                pdu = await reader.readexactly(length - 1)
+                self.requests += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                writer.write(self._answer(transaction, unit, pdu))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _answer(self, transaction, unit, pdu):
+        function = pdu[0]
+        if function != READ_HOLDING_REGISTERS:
+            # illegal function
+            body = struct.pack(">BB", function | 0x80, 1)
+        else:
+            address, count = struct.unpack(">HH", pdu[1:5])
+            addresses = range(address, address + count)
+            if self.strict and any(address not in self.words for address in addresses):
+                body = struct.pack(">BB", function | 0x80, ILLEGAL_DATA_ADDRESS)
+            else:
+                words = [self.words.get(address, 0) for address in addresses]
+                body = struct.pack(f">BB{count}H", function, 2 * count, *words)
+        return struct.pack(">HHHB", transaction, 0, len(body) + 1, unit) + body
+
+    async def async_start(self, host="127.0.0.1", port=0):
+        """Start serving, returns the server, its port is server.sockets[0].getsockname()[1]."""
+        return await asyncio.start_server(self.handle, host, port)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5020)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = await MockModbus(latency=args.latency).async_start(args.host, args.port)
+    print(f"Serving Modbus-TCP on {args.host}:{args.port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,122 @@
+"""
+Local stand-in for the eSolar portal, serving the JSON fixtures of a sensors mode.
+Used by the benchmarks to exercise SAJeSolarMeterData without the live portal, with
+injectable latency, errors and session expiry.
+"""
+
+import asyncio
+import os
+import random
+import secrets
+
+from aiohttp import web
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+# Fixture directory of every sensors mode
+MODES = {"None": "none", "h1": "h1", "saj_sec": "saj_sec"}
+
+ROUTES = (
+    ("POST", "monitor/site/getUserPlantList"),
+    ("POST", "monitor/site/getPlantDetailInfo"),
+    ("POST", "monitor/site/getPlantDetailChart2"),
+    ("POST", "monitor/site/getStoreOrAcDevicePowerInfo"),
+    ("POST", "monitor/site/getPlantMeterDetailInfo"),
+    ("GET", "monitor/site/getPlantMeterEnergyPreviewInfo"),
+    ("POST", "monitor/site/getPlantMeterChartData"),
+    ("POST", "cloudMonitor/device/findDevicePageList"),
+    ("POST", "cloudmonitor/plantMeterModule/getPlantMeterModuleList"),
+)
+
+SESSION_COOKIE = "JSESSIONID"
+
+
+class MockPortal(object):
+    """aiohttp application imitating the eSolar portal.
+
+    latency:      seconds added to every response, jitter adds up to that many seconds more
+    error_rate:   chance a data request answers with error_status
+    expire_every: expire the session after that many data requests, 0 never expires
+    fixtures:     response body by endpoint name, an endpoint without one answers 404
+    """
+
+    def __init__(self, mode="None", path="saj", latency=0.0, jitter=0.0, error_rate=0.0, error_status=502, expire_every=0):
+        self.mode = mode
+        self.path = path
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.expire_every = expire_every
+        self.requests = {}
+        self.logins = 0
+        self._sessions = set()
+        self._served = 0
+        self.fixtures = self._load_fixtures(MODES[mode])
+
+    @staticmethod
+    def _load_fixtures(directory):
+        fixtures = {}
+        for name in os.listdir(os.path.join(FIXTURES, directory)):
+            with open(os.path.join(FIXTURES, directory, name), "rb") as file:
+                fixtures[os.path.splitext(name)[0]] = file.read()
+        return fixtures
+
+    def expire_sessions(self):
+        """Forget every logged in session, the next data request is redirected to the login page."""
+        self._sessions.clear()
+
+    def application(self):
+        app = web.Application()
+        app.router.add_post(f"/{self.path}/login", self._login)
+        app.router.add_post(f"/{self.path}/logout", self._logout)
+        for method, route in ROUTES:
+            app.router.add_route(method, f"/{self.path}/{route}", self._data)
+        return app
+
+    async def _delay(self):
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+
+    async def _login(self, request):
+        await self._delay()
+        form = await request.post()
+        if not form.get("username") or not form.get("password"):
+            return web.Response(status=200, content_type="text/html", text="<html>login</html>")
+        self.logins += 1
+        token = secrets.token_hex(16)
+        self._sessions.add(token)
+        response = web.Response(status=200, content_type="text/html", text="<html>home</html>")
+        response.set_cookie(SESSION_COOKIE, token)
+        return response
+
+    async def _logout(self, request):
+        self._sessions.discard(request.cookies.get(SESSION_COOKIE))
+        return web.Response(status=200, content_type="text/html", text="<html>login</html>")
+
+    async def _data(self, request):
+        name = request.path.rsplit("/", 1)[1]
+        self.requests[name] = self.requests.get(name, 0) + 1
+        await self._delay()
+        if request.cookies.get(SESSION_COOKIE) not in self._sessions:
+            raise web.HTTPFound(f"/{self.path}/login")
+        self._served += 1
+        if self.expire_every and self._served % self.expire_every == 0:
+            self.expire_sessions()
+        if self.error_rate and random.random() < self.error_rate:
+            return web.Response(status=self.error_status, text="Bad Gateway")
+        if name not in self.fixtures:
+            return web.Response(status=404, text=f"No fixture for {name}")
+        return web.Response(status=200, content_type="application/json", body=self.fixtures[name])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mode", choices=list(MODES), default="None")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+    web.run_app(MockPortal(args.mode, latency=args.latency).application(), port=args.port)
@@ -0,0 +1,258 @@
+"""
+Backfill of the solar production history of the eSolar portal into the long-term
+statistics of Home Assistant, so the Energy dashboard of a new installation is not empty.
+The portal charts of past days, months or years are walked in chronological batches,
+fetched with bounded concurrency, and a checkpoint after every imported batch lets an
+interrupted backfill resume where it stopped. The cumulative sum continues from the
+statistics imported before, so separate backfills add up.
+"""
+
+import asyncio
+import datetime
+import logging
+
+import aiohttp
+import voluptuous as vol
+
+from homeassistant.components.recorder import get_instance
+from homeassistant.components.recorder.models import StatisticData, StatisticMetaData
+from homeassistant.components.recorder.statistics import (
+    async_add_external_statistics,
+    get_last_statistics,
+    statistics_during_period,
+)
+from homeassistant.const import UnitOfEnergy
+import homeassistant.helpers.config_validation as cv
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt, slugify
+
+from .const import DOMAIN
+from .session import EsolarError
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+
+SERVICE_BACKFILL = "backfill_statistics"
+
+ATTR_START = "start"
+ATTR_END = "end"
+ATTR_RESOLUTION = "resolution"
+ATTR_PLANTUID = "plantuid"
+ATTR_RESTART = "restart"
+
+# Statistics resolution -> chartDateType of the portal chart holding it
+RESOLUTION_HOUR = "hour"    # day charts, the power curve summed per hour
+RESOLUTION_DAY = "day"      # month charts, energy per day
+RESOLUTION_MONTH = "month"  # year charts, energy per month
+CHART_DATE_TYPES = {RESOLUTION_HOUR: 1, RESOLUTION_DAY: 2, RESOLUTION_MONTH: 3}
+
+# Charts fetched at the same time, and charts fetched and imported per checkpoint
+BACKFILL_CONCURRENCY = 4
+BACKFILL_BATCH = 16
+
+SERVICE_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_START): cv.date,
+        vol.Optional(ATTR_END): cv.date,
+        vol.Optional(ATTR_RESOLUTION, default=RESOLUTION_DAY): vol.In(list(CHART_DATE_TYPES)),
+        vol.Optional(ATTR_PLANTUID): cv.string,
+        vol.Optional(ATTR_RESTART, default=False): cv.boolean,
+    }
+)
+
+
+def chart_periods(start, end, resolution):
+    """Return the first day of every chart covering start up to and including end."""
+    if resolution == RESOLUTION_HOUR:
+        return [start + datetime.timedelta(days=days) for days in range((end - start).days + 1)]
+    if resolution == RESOLUTION_DAY:
+        periods = [start.replace(day=1)]
+        while periods[-1].replace(day=28) + datetime.timedelta(days=4) <= end:
+            periods.append((periods[-1].replace(day=28) + datetime.timedelta(days=4)).replace(day=1))
+        return periods
+    return [datetime.date(year, 1, 1) for year in range(start.year, end.year + 1)]
+
+
+def period_end(period, resolution):
+    """Return the last day of the chart starting at period."""
+    if resolution == RESOLUTION_HOUR:
+        return period
+    if resolution == RESOLUTION_DAY:
+        return (period.replace(day=28) + datetime.timedelta(days=4)).replace(day=1) - datetime.timedelta(days=1)
+    return period.replace(month=12, day=31)
+
+
+def slot_start(day, hour=0):
+    """Return the start of a statistics slot in the time zone of Home Assistant."""
+    return datetime.datetime.combine(day, datetime.time(hour), tzinfo=dt.DEFAULT_TIME_ZONE)
+
+
+def chart_energy(chart, period, resolution):
+    """Return (date, hour, kWh) of every slot of a portal chart.
+
+    Day charts sample the power in W, every sample counts for the time until the
+    next xAxis label. Month and year charts hold kWh per day and month.
+    """
+    values = [float(value or 0) for value in chart["dataCountList"][0]]
+    if resolution == RESOLUTION_DAY:
+        return [(period + datetime.timedelta(days=idx), 0, kwh) for idx, kwh in enumerate(values) if (period + datetime.timedelta(days=idx)).month == period.month]
+    if resolution == RESOLUTION_MONTH:
+        return [(period.replace(month=idx + 1), 0, kwh) for idx, kwh in enumerate(values[:12])]
+
+    minutes = [int(label[:2]) * 60 + int(label[3:5]) for label in chart["xAxis"]]
+    hours = [0.0] * 24
+    for idx, watt in enumerate(values[:len(minutes)]):
+        step = (minutes[idx + 1] if idx + 1 < len(minutes) else 24 * 60) - minutes[idx]
+        hours[minutes[idx] // 60] += watt * step / 60 / 1000
+    return [(period, hour, kwh) for hour, kwh in enumerate(hours)]
+
+
+class StatisticsBackfill(object):
+    """Imports the production history of one plant as external statistics."""
+
+    def __init__(self, hass, data, plantuid, plantname=None):
+        self._hass     = hass
+        self._data     = data
+        self.plantuid  = plantuid
+        self.statistic_id = f"{DOMAIN}:{slugify(plantuid)}_pv_energy"
+        self._name     = f"esolar {plantname or plantuid} solar production"
+        self._store    = Store(hass, STORAGE_VERSION, f"{DOMAIN}.backfill.{slugify(plantuid)}")
+        self._lock     = asyncio.Lock()
+
+    @property
+    def running(self):
+        return self._lock.locked()
+
+    async def async_run(self, start, end=None, resolution=RESOLUTION_DAY, restart=False):
+        """Backfill start up to and including end (default yesterday), resuming a stopped run.
+
+        The checkpoint of the statistic holds the first and the last imported day of
+        its backfill, a run starting within them continues after the last one.
+        """
+        end = min(end or datetime.date.today(), datetime.date.today() - datetime.timedelta(days=1))
+        async with self._lock:
+            checkpoint = await self._store.async_load() or {}
+            if (
+                restart
+                or checkpoint.get("statistic_id") != self.statistic_id
+                or checkpoint.get(ATTR_RESOLUTION) != resolution
+                or checkpoint["imported"] is None
+                or not checkpoint[ATTR_START] <= start.isoformat() <= checkpoint["imported"]
+            ):
+                checkpoint = {"statistic_id": self.statistic_id, ATTR_RESOLUTION: resolution, ATTR_START: start.isoformat(), "imported": None}
+            else:
+                start = datetime.date.fromisoformat(checkpoint["imported"]) + datetime.timedelta(days=1)
+            if end < start:
+                _LOGGER.warning("Nothing to backfill for %s between %s and %s", self.plantuid, start, end)
+                return
+
+            # a year chart has a slot per month, starting on the first day of the month,
+            # a partly imported month is imported again
+            first = start.replace(day=1) if resolution == RESOLUTION_MONTH else start
+            periods = chart_periods(first, end, resolution)
+            total = await self._async_sum_before(slot_start(first))
+            imported = 0.0
+            semaphore = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+            metadata = StatisticMetaData(
+                has_mean=False,
+                has_sum=True,
+                name=self._name,
+                source=DOMAIN,
+                statistic_id=self.statistic_id,
+                unit_of_measurement=UnitOfEnergy.KILO_WATT_HOUR,
+            )
+            _LOGGER.info("Backfilling %s from %s to %s per %s in %d charts", self.statistic_id, start, end, resolution, len(periods))
+
+            async def fetch(period):
+                async with semaphore:
+                    return await self._data.async_get_plant_chart(self.plantuid, CHART_DATE_TYPES[resolution], period)
+
+            for index in range(0, len(periods), BACKFILL_BATCH):
+                batch = periods[index:index + BACKFILL_BATCH]
+                try:
+                    charts = await asyncio.gather(*(fetch(period) for period in batch))
+                except (EsolarError, aiohttp.ClientError, asyncio.TimeoutError) as err:
+                    _LOGGER.error("Backfill of %s stopped at %s, call the service again to resume: %s", self.statistic_id, batch[0], err)
+                    return
+
+                statistics = []
+                for period, chart in zip(batch, charts):
+                    try:
+                        energy = chart_energy(chart, period, resolution)
+                    except (KeyError, IndexError, TypeError, ValueError) as err:
+                        _LOGGER.warning("Skipping the %s chart of %s in the backfill of %s: %s", resolution, period, self.statistic_id, err)
+                        energy = []
+                    for day, hour, kwh in energy:
+                        if first <= day <= end:
+                            total += kwh
+                            imported += kwh
+                            statistics.append(StatisticData(start=slot_start(day, hour), state=kwh, sum=total))
+                if statistics:
+                    async_add_external_statistics(self._hass, metadata, statistics)
+                checkpoint["imported"] = min(end, period_end(batch[-1], resolution)).isoformat()
+                await self._store.async_save(checkpoint)
+
+            await self._async_shift_after(metadata, slot_start(end + datetime.timedelta(days=1)), total)
+            _LOGGER.info("Backfill of %s finished, %.2f kWh imported", self.statistic_id, imported)
+
+    async def _async_statistics(self, start_time, end_time):
+        """Return the imported hourly statistics starting from start_time and before end_time."""
+        recorder = get_instance(self._hass)
+        # imports are queued, read them once the recorder wrote them
+        await recorder.async_block_till_done()
+        statistics = await recorder.async_add_executor_job(
+            statistics_during_period, self._hass, start_time, end_time, {self.statistic_id}, "hour", None, {"state", "sum"}
+        )
+        return statistics.get(self.statistic_id, [])
+
+    async def _async_sum_before(self, start_time):
+        """Return the cumulative sum of the last imported statistic before start_time, 0 when there is none."""
+        recorder = get_instance(self._hass)
+        await recorder.async_block_till_done()
+        last = await recorder.async_add_executor_job(get_last_statistics, self._hass, 1, self.statistic_id, False, {"sum"})
+        rows = last.get(self.statistic_id, [])
+        if rows and rows[0]["start"] >= start_time.timestamp():
+            # an earlier range is backfilled after a later one
+            rows = await self._async_statistics(dt.utc_from_timestamp(0), start_time)
+        return (rows[-1]["sum"] or 0.0) if rows else 0.0
+
+    async def _async_shift_after(self, metadata, start_time, total):
+        """Continue the sum of the statistics imported after start_time from total, so it never goes down."""
+        rows = await self._async_statistics(start_time, None)
+        if not rows:
+            return
+        shift = total + (rows[0]["state"] or 0.0) - (rows[0]["sum"] or 0.0)
+        if abs(shift) < 1e-6:
+            return
+        _LOGGER.debug("Shifting the sum of %d later statistics of %s by %.3f kWh", len(rows), self.statistic_id, shift)
+        async_add_external_statistics(self._hass, metadata, [
+            StatisticData(start=dt.utc_from_timestamp(row["start"]), state=row["state"], sum=(row["sum"] or 0.0) + shift)
+            for row in rows
+        ])
+
+
+def async_register_backfill(hass, backfill):
+    """Register the backfill of a plant, and the backfill service on first use."""
+    backfills = hass.data.setdefault(DOMAIN, {}).setdefault("backfills", {})
+    backfills[backfill.plantuid] = backfill
+    if hass.services.has_service(DOMAIN, SERVICE_BACKFILL):
+        return
+
+    async def async_handle_backfill(call):
+        plantuid = call.data.get(ATTR_PLANTUID)
+        targets = [backfills[plantuid]] if plantuid in backfills else list(backfills.values()) if plantuid is None else []
+        if not targets:
+            _LOGGER.error("No eSolar plant with plantuid %s to backfill", plantuid)
+            return
+        for target in targets:
+            if target.running:
+                _LOGGER.warning("Backfill of %s is already running", target.statistic_id)
+                continue
+            # years of history take a while, don't block the service call
+            hass.async_create_background_task(
+                target.async_run(call.data[ATTR_START], call.data.get(ATTR_END), call.data[ATTR_RESOLUTION], call.data[ATTR_RESTART]),
+                f"{DOMAIN} backfill {target.plantuid}",
+            )
+
+    hass.services.async_register(DOMAIN, SERVICE_BACKFILL, async_handle_backfill, schema=SERVICE_SCHEMA)
@@ -0,0 +1,3 @@
+"""Constants for the SAJ eSolar component."""
+
+DOMAIN = "saj_esolar"
@@ -0,0 +1,27 @@
+"""Coordinator owning the eSolar poll schedule and the shared data snapshot."""
+
+import logging
+
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+
+from .const import DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class SAJeSolarCoordinator(DataUpdateCoordinator):
+    """Polls the eSolar portal once per interval for all entities of a platform entry."""
+
+    def __init__(self, hass, data, update_interval, scheduler=None):
+        # the data keeps the objects of unchanged plants, so listeners are only called when something changed
+        super().__init__(hass, _LOGGER, name=DOMAIN, update_interval=update_interval, always_update=False)
+        self.esolar = data
+        self._scheduler = scheduler
+
+    async def _async_update_data(self):
+        """Fetch a new snapshot, raises UpdateFailed when the portal can't be polled."""
+        data = await self.esolar.async_update()
+        if self._scheduler is not None:
+            self.update_interval = self._scheduler.next_interval(data)
+            _LOGGER.debug("Next eSolar poll in %s", self.update_interval)
+        return data
@@ -0,0 +1,41 @@
+"""
+Lean decoding of the portal responses.
+Bodies are decoded with orjson when it is installed, and a poll only keeps the fields
+of a response the sensors, the fetch plan and the scheduler read. The large chart
+arrays of a response nobody reads are dropped right after decoding.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+json_loads = orjson.loads if orjson is not None else json.loads
+
+
+def add_fields(tree, path):
+    """Add a key path to a field tree, the path keeps the whole value it ends in or that a list index reaches."""
+    node = tree
+    for idx, key in enumerate(path):
+        if idx + 1 == len(path) or not isinstance(path[idx + 1], str):
+            node[key] = None
+            return
+        if key in node and node[key] is None:
+            return
+        node = node.setdefault(key, {})
+
+
+def project(data, fields):
+    """Return the parts of decoded data named by a field tree of key -> subtree, None keeps a value whole.
+
+    The tree of a list applies to every item.
+    """
+    if fields is None:
+        return data
+    if isinstance(data, list):
+        return [project(item, fields) for item in data]
+    if not isinstance(data, dict):
+        return data
+    return {key: project(data[key], subtree) for key, subtree in fields.items() if key in data}
@@ -0,0 +1,45 @@
+"""
+Request de-duplication for one poll cycle.
+Portal requests are keyed by endpoint and normalized parameters, so requests asking
+for the same data share one network call, also while that call is still in flight.
+"""
+
+import asyncio
+import logging
+from urllib.parse import parse_qsl, urlsplit
+
+_LOGGER = logging.getLogger(__name__)
+
+# Parameters that don't change what an endpoint answers, by endpoint (None for every endpoint).
+# "_" is a cache buster.
+IGNORED_PARAMS = {
+    None: ("_",),
+}
+
+
+def request_key(endpoint, url, data=None):
+    """Return the key of a request: its endpoint with the sorted, non empty parameters that matter."""
+    params = parse_qsl(urlsplit(url).query, keep_blank_values=True)
+    if isinstance(data, str):
+        params += parse_qsl(data, keep_blank_values=True)
+    elif data:
+        params += list(data.items())
+    ignored = IGNORED_PARAMS[None] + IGNORED_PARAMS.get(endpoint, ())
+    return endpoint, tuple(sorted((name, str(value)) for name, value in params if value != "" and name not in ignored))
+
+
+class RequestCache(object):
+    """Single flight cache of the requests of one poll cycle."""
+
+    def __init__(self):
+        self._requests = {}
+
+    async def async_fetch(self, key, fetch):
+        """Return the answer of the request with key, calling fetch only for the first caller."""
+        task = self._requests.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fetch())
+            self._requests[key] = task
+        else:
+            _LOGGER.debug("Serving %s from a request of this poll", key[0])
+        return await task
@@ -0,0 +1,45 @@
+"""
+Single flight guard of the data source updates.
+Callers arriving while an update runs await that update instead of starting another
+one, so every entity sees the same poll and the portal never gets duplicate polls.
+"""
+
+import asyncio
+import logging
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class SingleFlight(object):
+    """Runs one call at a time, the callers arriving meanwhile share its result.
+
+    A call within min_interval seconds of the end of the previous successful call
+    returns that result without running again. A failed call fails all its callers
+    and the next call runs again.
+    """
+
+    def __init__(self, min_interval=0.0):
+        self._min_interval = min_interval
+        self._future   = None
+        self._finished = None
+        self._result   = None
+
+    async def async_call(self, call):
+        if self._future is None:
+            if self._finished is not None and time.monotonic() - self._finished < self._min_interval:
+                _LOGGER.debug("Updated %.1fs ago, serving that update", time.monotonic() - self._finished)
+                return self._result
+            self._future = asyncio.ensure_future(self._async_run(call))
+        else:
+            _LOGGER.debug("Update in flight, awaiting it")
+        # a cancelled caller doesn't cancel the update the other callers await
+        return await asyncio.shield(self._future)
+
+    async def _async_run(self, call):
+        try:
+            self._result = await call()
+            self._finished = time.monotonic()
+            return self._result
+        finally:
+            self._future = None
@@ -0,0 +1,131 @@
+"""
+Instrumentation of the portal calls of a poll cycle.
+Every endpoint gets a latency histogram, its response sizes, status codes, retries and
+JSON decode time, so slow endpoints and regressions show without reading debug logs.
+"""
+
+import collections
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the latency histogram buckets, the last bucket is everything slower
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram(object):
+    """Counts of the observed values per bucket, with their sum for the mean."""
+
+    __slots__ = ("bounds", "counts", "count", "sum", "last")
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count  = 0
+        self.sum    = 0.0
+        self.last   = None
+
+    def observe(self, value):
+        idx = next((idx for idx, bound in enumerate(self.bounds) if value <= bound), len(self.bounds))
+        self.counts[idx] += 1
+        self.count += 1
+        self.sum   += value
+        self.last   = value
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def as_dict(self):
+        labels = [f"<={bound}" for bound in self.bounds] + [f">{self.bounds[-1]}"]
+        return dict(zip(labels, self.counts))
+
+
+class EndpointMetrics(object):
+    """What the requests to one portal endpoint did."""
+
+    def __init__(self):
+        self.latency   = Histogram()
+        self.decode    = Histogram()
+        self.statuses  = collections.Counter()
+        self.requests  = 0
+        self.failures  = 0
+        self.retries   = 0
+        self.last_size = None
+        self.bytes     = 0
+
+    def record_response(self, status, latency, size=None, decode=None):
+        """Record an answered request, size and decode time of a JSON body."""
+        self.requests += 1
+        self.statuses[status] += 1
+        self.latency.observe(latency)
+        if size is not None:
+            self.last_size = size
+            self.bytes += size
+        if decode is not None:
+            self.decode.observe(decode)
+
+    def record_error(self, error, latency):
+        """Record a request that got no answer, the error names it in the status codes."""
+        self.requests += 1
+        self.failures += 1
+        self.statuses[type(error).__name__] += 1
+        self.latency.observe(latency)
+
+    def record_retry(self):
+        self.retries += 1
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "retries": self.retries,
+            "status_codes": {str(status): count for status, count in self.statuses.items()},
+            "latency_last": self.latency.last,
+            "latency_mean": self.latency.mean,
+            "latency_histogram": self.latency.as_dict(),
+            "response_size_last": self.last_size,
+            "response_bytes": self.bytes,
+            "decode_last": self.decode.last,
+            "decode_mean": self.decode.mean,
+        }
+
+
+class PollMetrics(object):
+    """The endpoint metrics and the poll cycle durations of one data object."""
+
+    def __init__(self):
+        self.endpoints = {}
+        self.cycles    = Histogram()
+        self.failed_cycles = 0
+        self._listeners = []
+
+    def endpoint(self, url):
+        """Return the metrics of the endpoint of a portal url, named after the last part of its path."""
+        name = url.split("?", 1)[0].rstrip("/").rsplit("/", 1)[-1]
+        if name not in self.endpoints:
+            self.endpoints[name] = EndpointMetrics()
+        return self.endpoints[name]
+
+    def record_cycle(self, duration, success):
+        """Record a finished poll cycle and tell the listeners."""
+        self.cycles.observe(duration)
+        if not success:
+            self.failed_cycles += 1
+        for listener in list(self._listeners):
+            listener()
+
+    def add_listener(self, listener):
+        """Call listener after every poll cycle, returns a function removing it again."""
+        self._listeners.append(listener)
+        return lambda: self._listeners.remove(listener)
+
+    def as_dict(self):
+        return {
+            "cycles": self.cycles.count,
+            "failed_cycles": self.failed_cycles,
+            "cycle_last": self.cycles.last,
+            "cycle_mean": self.cycles.mean,
+            "cycle_histogram": self.cycles.as_dict(),
+            "endpoints": {name: metrics.as_dict() for name, metrics in self.endpoints.items()},
+        }
@@ -0,0 +1,127 @@
+"""
+Minimal Modbus-TCP client for the local network interface of SAJ inverters.
+Only reads holding registers (function 3), which is all the local data source needs,
+so the component keeps working without an extra Modbus library.
+"""
+
+import asyncio
+import logging
+import struct
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_PORT = 502
+DEFAULT_UNIT = 1
+# Seconds a request to the inverter may take, it answers in milliseconds on the LAN
+DEFAULT_TIMEOUT = 5.0
+
+READ_HOLDING_REGISTERS = 0x03
+# Most registers a single read may ask for, by the Modbus specification
+MAX_REGISTERS = 125
+# Registers between two values that are read and dropped instead of doing another read
+MAX_GAP = 16
+
+# Register type -> number of registers and struct format of the big endian value
+REGISTER_TYPES = {
+    "int16":  (1, ">h"),
+    "uint16": (1, ">H"),
+    "int32":  (2, ">i"),
+    "uint32": (2, ">I"),
+}
+
+
+class ModbusError(Exception):
+    """The inverter answered with a Modbus exception or with a malformed frame."""
+
+
+class Register(object):
+    """A value of the inverter: its address, type and the scale of its raw value."""
+
+    __slots__ = ("address", "type", "scale")
+
+    def __init__(self, address, type="int16", scale=1.0):
+        self.address = address
+        self.type    = type
+        self.scale   = scale
+
+    @property
+    def count(self):
+        return REGISTER_TYPES[self.type][0]
+
+    def decode(self, words):
+        """Return the scaled value of the register words."""
+        raw = struct.unpack(REGISTER_TYPES[self.type][1], struct.pack(f">{self.count}H", *words))[0]
+        return raw * self.scale
+
+
+def register_blocks(registers):
+    """Return (address, count) of the reads covering the registers, registers close to each other share a read."""
+    blocks = []
+    for register in sorted(registers, key=lambda register: register.address):
+        end = register.address + register.count
+        if blocks and end - blocks[-1][0] <= MAX_REGISTERS and register.address - sum(blocks[-1]) <= MAX_GAP:
+            start, count = blocks[-1]
+            blocks[-1] = (start, max(count, end - start))
+        else:
+            blocks.append((register.address, register.count))
+    return blocks
+
+
+class ModbusClient(object):
+    """Keeps one TCP connection to the inverter, requests are sent one at a time."""
+
+    def __init__(self, host, port=DEFAULT_PORT, unit=DEFAULT_UNIT, timeout=DEFAULT_TIMEOUT):
+        self.host     = host
+        self.port     = port
+        self.unit     = unit
+        self._timeout = timeout
+        self._reader  = None
+        self._writer  = None
+        self._lock    = asyncio.Lock()
+        self._transaction = 0
+
+    async def async_read_registers(self, address, count):
+        """Return the words of count holding registers from address, reconnecting once when the connection dropped."""
+        async with self._lock:
+            for attempt in (1, 2):
+                try:
+                    return await asyncio.wait_for(self._read(address, count), self._timeout)
+                except (ConnectionError, asyncio.IncompleteReadError) as err:
+                    await self._close()
+                    if attempt == 2:
+                        raise
+                    _LOGGER.debug("Modbus connection to %s lost, reconnecting: %s", self.host, err)
+                except (asyncio.TimeoutError, ModbusError):
+                    # the answer of this request may still arrive, don't read it as the next one
+                    await self._close()
+                    raise
+
+    async def _read(self, address, count):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self._transaction = (self._transaction + 1) & 0xFFFF
+        # MBAP header (transaction, protocol 0, length, unit) and the read request
+        self._writer.write(struct.pack(">HHHBBHH", self._transaction, 0, 6, self.unit, READ_HOLDING_REGISTERS, address, count))
+        await self._writer.drain()
+        transaction, protocol, length, unit = struct.unpack(">HHHB", await self._reader.readexactly(7))
+        pdu = await self._reader.readexactly(length - 1)
+        if transaction != self._transaction or protocol != 0:
+            raise ModbusError(f"Unexpected Modbus frame {transaction}/{protocol} from {self.host}")
+        if pdu[0] == READ_HOLDING_REGISTERS | 0x80:
+            raise ModbusError(f"Modbus exception {pdu[1]} reading {count} registers at {address:#06x}")
+        if pdu[0] != READ_HOLDING_REGISTERS or pdu[1] != 2 * count:
+            raise ModbusError(f"Malformed Modbus answer reading {count} registers at {address:#06x}")
+        return list(struct.unpack(f">{count}H", pdu[2:2 + 2 * count]))
+
+    async def _close(self):
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    async def async_close(self):
+        async with self._lock:
+            await self._close()
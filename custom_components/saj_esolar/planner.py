@@ -0,0 +1,160 @@
+"""
+Dependency aware fetch planner for the eSolar portal calls of one poll cycle.
+Every step starts as soon as the steps it requires are finished, so the duration of
+a poll is the length of the longest dependency chain instead of the sum of all calls.
+"""
+
+import asyncio
+import logging
+
+from .decode import project
+
+_LOGGER = logging.getLogger(__name__)
+
+# Number of portal requests one poll cycle may have in flight at the same time
+MAX_CONCURRENT_REQUESTS = 4
+
+# Refresh tiers, fast steps run every poll, slow steps (charts and totals) less often
+TIER_FAST = "fast"
+TIER_SLOW = "slow"
+
+
+class FetchStep(object):
+    """One node of the fetch plan.
+
+    A step either does a portal call (fetch) or derives a value from the results
+    of the steps it requires (derive). Both get the results collected so far.
+    A fetch result only keeps the fields of its field tree, see decode.project.
+    """
+
+    def __init__(self, name, requires=(), fetch=None, derive=None, tier=TIER_FAST, fields=None):
+        self.name     = name
+        self.requires = tuple(requires)
+        self.fetch    = fetch
+        self.derive   = derive
+        self.tier     = tier
+        self.fields   = fields
+
+
+class FetchPlanner(object):
+    """Runs the fetch steps concurrently in dependency order."""
+
+    def __init__(self, steps, semaphore=None):
+        self._steps     = list(steps)
+        self._semaphore = semaphore
+        names = {step.name for step in self._steps}
+        for step in self._steps:
+            missing = set(step.requires) - names
+            if missing:
+                raise ValueError(f"Fetch step {step.name} requires unknown steps {missing}")
+
+    @property
+    def steps(self):
+        return self._steps
+
+    def select(self, names):
+        """Return the names of the named steps of the plan and of the steps they require."""
+        steps = {step.name: step for step in self._steps}
+        pending = [name for name in names if name in steps]
+        selected = set()
+        while pending:
+            name = pending.pop()
+            if name not in selected:
+                selected.add(name)
+                pending.extend(steps[name].requires)
+        return selected
+
+    async def async_run(self, results=None, previous=None, deadline=None, errors=None):
+        """Run all steps and return their results by step name.
+
+        With the results of the previous run, a fetch result equal to the previous one
+        keeps the previous object and a derive step whose inputs are all unchanged
+        reuses its previous value instead of parsing them again.
+
+        When the deadline (event loop time) passes, the unfinished steps are cancelled
+        and the results of the finished steps are returned.
+
+        With an errors dict a failing step doesn't stop the run: its error is recorded
+        by step name, for the steps requiring it and for the steps cut off by the
+        deadline too, and the other steps carry on.
+        """
+        results = dict(results or {})
+        previous = previous or {}
+        loop = asyncio.get_running_loop()
+        finished = {step.name: loop.create_future() for step in self._steps}
+        semaphore = self._semaphore or asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+        for name in results:
+            if name in finished:
+                finished[name].set_result(None)
+
+        async def run(step):
+            if step.name in results:
+                return
+            for name in step.requires:
+                await finished[name]
+            failed = [errors[name] for name in step.requires if errors is not None and name in errors]
+            if failed:
+                errors[step.name] = failed[0]
+            else:
+                try:
+                    if step.fetch is not None:
+                        async with semaphore:
+                            result = project(await step.fetch(results), step.fields)
+                        if step.name in previous and previous[step.name] == result:
+                            result = previous[step.name]
+                        results[step.name] = result
+                    elif step.name in previous and all(results[name] is previous.get(name) for name in step.requires):
+                        results[step.name] = previous[step.name]
+                    else:
+                        results[step.name] = step.derive(results)
+                except Exception as err:
+                    if errors is None:
+                        raise
+                    errors[step.name] = err
+            finished[step.name].set_result(None)
+
+        tasks = [asyncio.ensure_future(run(step)) for step in self._steps]
+        timeout = None if deadline is None else max(0.0, deadline - loop.time())
+        try:
+            done, pending = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if task.exception() is not None:
+                    raise task.exception()
+            if pending:
+                skipped = [step.name for step in self._steps if step.name not in results and step.name not in (errors or {})]
+                _LOGGER.debug("Poll deadline passed, skipping %s", skipped)
+                if errors is not None:
+                    for name in skipped:
+                        errors[name] = asyncio.TimeoutError("Poll deadline passed")
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return results
+
+    def depends_on(self, name, names):
+        """Return True when a step requires one of the named steps, directly or through the steps it requires."""
+        steps = {step.name: step for step in self._steps}
+        pending = list(steps[name].requires)
+        seen = set()
+        while pending:
+            required = pending.pop()
+            if required in names:
+                return True
+            if required not in seen:
+                seen.add(required)
+                pending.extend(steps[required].requires)
+        return False
+
+    def unchanged(self, results, previous, names):
+        """Return True when the result of every named step is the object of the previous run."""
+        return previous is not None and all(results.get(name) is previous.get(name) for name in names)
+
+    def origin(self, name):
+        """Return the fetch step the result of a step comes from, derive steps follow their first requirement."""
+        steps = {step.name: step for step in self._steps}
+        step = steps[name]
+        while step.fetch is None and step.requires:
+            step = steps[step.requires[0]]
+        return step.name
@@ -0,0 +1,101 @@
+"""
+Adaptive poll scheduling. The portal only has new data after the device uploaded
+(plantDetail.lastUploadTime), so we learn the upload cadence of every plant and
+poll just after the next expected upload, and back off while the sun is down.
+"""
+
+import collections
+import datetime
+import logging
+import statistics
+
+from homeassistant.const import SUN_EVENT_SUNRISE
+from homeassistant.helpers.sun import get_astral_event_next, is_up
+from homeassistant.util import dt as dt_util
+
+_LOGGER = logging.getLogger(__name__)
+
+UPLOAD_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Number of upload intervals the cadence is learned from
+CADENCE_SAMPLES = 6
+# Time the portal needs to process an upload before we poll it
+UPLOAD_MARGIN = datetime.timedelta(seconds=45)
+MIN_INTERVAL = datetime.timedelta(minutes=1)
+# Longest interval between polls while the sun is down
+NIGHT_INTERVAL = datetime.timedelta(hours=1)
+
+
+class PlantUploads(object):
+    """Learns the upload cadence of one plant from successive lastUploadTime values."""
+
+    def __init__(self):
+        self.last    = None
+        self.offset  = None
+        self._deltas = collections.deque(maxlen=CADENCE_SAMPLES)
+
+    def observe(self, upload, now):
+        """Record the lastUploadTime (plant clock) seen at now (our clock), both in seconds."""
+        if upload == self.last:
+            return
+        if self.last is not None and upload > self.last:
+            self._deltas.append(upload - self.last)
+        self.last = upload
+        # The plant clock has an unknown timezone, the smallest difference between
+        # seeing an upload and its upload time is the clock offset plus the portal delay
+        offset = now - upload
+        self.offset = offset if self.offset is None else min(self.offset, offset)
+
+    @property
+    def cadence(self):
+        return statistics.median(self._deltas) if self._deltas else None
+
+    def expected_next(self):
+        """Return when the next upload should be visible on our clock, or None while learning."""
+        if self.cadence is None:
+            return None
+        return self.last + self.cadence + self.offset
+
+
+class UploadScheduler(object):
+    """Computes the coordinator interval from the plant snapshots of the last poll."""
+
+    def __init__(self, hass, interval):
+        self._hass     = hass
+        self._interval = interval
+        self._plants   = {}
+
+    def next_interval(self, data):
+        now = dt_util.utcnow()
+        timestamp = now.timestamp()
+        idle = True
+        learning = False
+        expected = []
+
+        for plantuid, plant in data.items():
+            detail = plant.detail
+            uploads = self._plants.setdefault(plantuid, PlantUploads())
+            try:
+                upload = datetime.datetime.strptime(detail.lastUploadTime, UPLOAD_TIME_FORMAT)
+            except (AttributeError, TypeError, ValueError):
+                return self._interval
+            uploads.observe(upload.replace(tzinfo=datetime.timezone.utc).timestamp(), timestamp)
+            if uploads.cadence is not None:
+                expected.append((uploads.expected_next(), uploads.cadence))
+            else:
+                learning = True
+            idle = idle and not detail.nowPower and not detail.runningState
+
+        if idle and not is_up(self._hass):
+            # nothing will change before sunrise
+            sunrise = get_astral_event_next(self._hass, SUN_EVENT_SUNRISE, now)
+            return max(self._interval, min(sunrise - now, NIGHT_INTERVAL))
+
+        if learning or not expected:
+            return self._interval
+
+        upload, cadence = min(expected)
+        if timestamp - upload > cadence:
+            # the device stopped uploading, don't poll it every minute
+            return self._interval
+        return max(MIN_INTERVAL, datetime.timedelta(seconds=upload - timestamp) + UPLOAD_MARGIN)
@@ -4,8 +4,9 @@ This Sensor will read the private api of the eSolar portal at https://fop.saj-el
 """
 
 import asyncio
-from homeassistant.helpers.aiohttp_client import async_create_clientsession
+import dataclasses
 import datetime
+import time
 import calendar
 
 from functools import reduce
@@ -25,19 +26,70 @@ from homeassistant.components.sensor import (
 )
 from homeassistant.const import (
     CONF_RESOURCES,
+    CONF_SCAN_INTERVAL,
     CONF_USERNAME,
     CONF_PASSWORD,
     CONF_SENSORS,
+    EVENT_HOMEASSISTANT_STOP,
+    EntityCategory,
     PERCENTAGE,
     UnitOfEnergy,
     UnitOfPower,
 )
 
 CONF_PLANT_ID: Final = "plant_id"
+CONF_ALL_PLANTS: Final = "all_plants"
+CONF_TOPOLOGY_TTL: Final = "topology_ttl"
+CONF_PERSIST_TOPOLOGY: Final = "persist_topology"
+CONF_ADAPTIVE_POLLING: Final = "adaptive_polling"
+CONF_SLOW_SCAN_INTERVAL: Final = "slow_scan_interval"
+CONF_REQUEST_TIMEOUT: Final = "request_timeout"
+CONF_ENDPOINT_TIMEOUTS: Final = "endpoint_timeouts"
+CONF_POLL_DEADLINE: Final = "poll_deadline"
+CONF_STALE_AFTER: Final = "stale_after"
+CONF_SOURCE: Final = "source"
+CONF_LOCAL_HOST: Final = "local_host"
+CONF_LOCAL_PORT: Final = "local_port"
+CONF_LOCAL_UNIT: Final = "local_unit"
+CONF_LOCAL_REGISTERS: Final = "local_registers"
+CONF_LOCAL_SCAN_INTERVAL: Final = "local_scan_interval"
+CONF_SOURCE_PRIORITY: Final = "source_priority"
+CONF_MIN_UPDATE_INTERVAL: Final = "min_update_interval"
+
+SOURCE_HYBRID = "hybrid"
 from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.device_registry import DeviceInfo
 import homeassistant.helpers.config_validation as cv
 from homeassistant.helpers.entity import Entity
-from homeassistant.util import Throttle, dt
+from homeassistant.helpers.storage import Store
+from homeassistant.helpers.update_coordinator import CoordinatorEntity, UpdateFailed
+from homeassistant.core import callback
+from homeassistant.exceptions import PlatformNotReady
+from homeassistant.util import dt, slugify
+
+from .backfill import StatisticsBackfill, async_register_backfill
+from .const import DOMAIN
+from .coordinator import SAJeSolarCoordinator
+from .decode import add_fields
+from .dedupe import RequestCache, request_key
+from .metrics import PollMetrics
+from .planner import MAX_CONCURRENT_REQUESTS, TIER_FAST, TIER_SLOW, FetchPlanner, FetchStep
+from .scheduler import UploadScheduler
+from .series import ChartSeries
+from .modbus import DEFAULT_PORT, DEFAULT_UNIT, REGISTER_TYPES, ModbusClient, Register
+from .snapshot import EndpointSnapshot
+from .sources import (
+    H1_REGISTERS,
+    SOURCE_CLOUD,
+    SOURCE_LOCAL,
+    DataSource,
+    HybridSource,
+    LocalModbusSource,
+    local_paths,
+)
+from .telemetry import SNAPSHOT_PARTS, PlantSnapshot, part_paths
+from .session import REQUEST_TIMEOUT, EsolarError, async_get_pool
+from .topology import STORAGE_VERSION, TopologyCache, TopologyOutdated
 
 def add_months(sourcedate, months):
     month = sourcedate.month - 1 + months
@@ -65,10 +117,43 @@ DEVICE_TYPES = {
 }
 
 MIN_TIME_BETWEEN_UPDATES = datetime.timedelta(minutes=5)
+DEFAULT_TOPOLOGY_TTL = datetime.timedelta(hours=1)
+DEFAULT_SLOW_SCAN_INTERVAL = datetime.timedelta(minutes=15)
+DEFAULT_REQUEST_TIMEOUT = datetime.timedelta(seconds=REQUEST_TIMEOUT)
+DEFAULT_POLL_DEADLINE = datetime.timedelta(seconds=60)
+DEFAULT_STALE_AFTER = datetime.timedelta(minutes=30)
+DEFAULT_LOCAL_SCAN_INTERVAL = datetime.timedelta(seconds=10)
+DEFAULT_MIN_UPDATE_INTERVAL = datetime.timedelta(seconds=0)
+
+# Portal endpoint of the fetch steps that are not named after theirs
+STEP_ENDPOINTS = {
+    "devicePowerInfo": "getStoreOrAcDevicePowerInfo",
+}
+
+# Portal endpoints a poll cycle calls, a timeout can be configured for each of them
+PORTAL_ENDPOINTS = (
+    "getUserPlantList",
+    "getPlantDetailInfo",
+    "findDevicePageList",
+    "getPlantDetailChart2",
+    "getStoreOrAcDevicePowerInfo",
+    "getPlantMeterModuleList",
+    "getPlantMeterDetailInfo",
+    "getPlantMeterChartData",
+)
 
 SENSOR_PREFIX = 'esolar '
 ATTR_MEASUREMENT = "measurement"
 ATTR_SECTION = "section"
+ATTR_SAMPLES = "samples"
+ATTR_LAST_FETCHED = "last_fetched"
+ATTR_SOURCE_ENDPOINT = "source_endpoint"
+
+# Topology steps holding the identifiers the telemetry calls are made with
+IDENTIFIER_STEPS = ("plantuid", "deviceSnArr", "moduleSn")
+# Errors of a step using an identifier that tell the portal doesn't know it: the answer
+# lacks the plant, device or module. Other errors keep the last known data of the step.
+IDENTIFIER_ERRORS = (KeyError, IndexError, TypeError)
 
 SENSOR_LIST = {
     "nowPower",
@@ -139,6 +224,8 @@ SENSOR_LIST = {
     "pvDirection",
     "pvPower",
     "solarPower",
+    #per device
+    "deviceOnline",
 }
 
 SENSOR_TYPES: Final[tuple[SensorEntityDescription, ...]] = (
@@ -529,43 +616,386 @@ SENSOR_TYPES: Final[tuple[SensorEntityDescription, ...]] = (
         device_class=SensorDeviceClass.ENERGY,
         state_class=SensorStateClass.TOTAL_INCREASING,
     ),
+    SensorEntityDescription(
+        key="deviceOnline",
+        name="online",
+        icon="mdi:solar-panel-large",
+    ),
 )
 
-PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
+BATTERY_DIRECTIONS = {0: "Standby", 1: "Discharging", -1: "Charging"}
+POWER_DIRECTIONS = {1: "Exporting", -1: "Importing"}
+
+
+def yes_no(value):
+    return "Yes" if int(value) else "No"
+
+
+def battery_direction(value):
+    return BATTERY_DIRECTIONS.get(value, f"Unknown: {value}")
+
+
+def power_direction(name):
+    def convert(value):
+        if value in POWER_DIRECTIONS:
+            return POWER_DIRECTIONS[value]
+        _LOGGER.error(f"{name} unknown value: {value}")
+        return value
+    return convert
+
+
+def last_sample(series):
+    return series.values[-1] if len(series) else None
+
+
+class Extractor(object):
+    """Where a sensor value lives in the PlantSnapshot of a plant and how to convert it.
+
+    When the value is missing or None the sensor keeps its previous state.
+    """
+
+    __slots__ = ("path", "convert")
+
+    def __init__(self, path, convert=None):
+        self.path    = tuple(path)
+        self.convert = convert
+
+    def for_device(self, devicesn):
+        """Return the extractor of the value of one device, the serial keys the part by device."""
+        return Extractor(self.path[:1] + (devicesn,) + self.path[1:], self.convert)
+
+    def extract(self, data):
+        try:
+            for part in self.path:
+                data = data[part] if isinstance(data, (dict, list)) else getattr(data, part)
+        except (AttributeError, KeyError, IndexError, TypeError):
+            return None
+        if data is None:
+            return None
+        return self.convert(data) if self.convert else data
+
+
+# Sensor key -> sensors mode -> extractor, the None mode applies to every mode
+SENSOR_EXTRACTORS = {
+    "devOnlineNum":         {None: Extractor(("detail", "devOnlineNum"), yes_no)},
+    "nowPower":             {None: Extractor(("detail", "nowPower"))},
+    "runningState":         {None: Extractor(("detail", "runningState"), yes_no)},
+    "todayElectricity":     {None: Extractor(("detail", "todayElectricity"))},
+    "monthElectricity":     {None: Extractor(("detail", "monthElectricity"))},
+    "yearElectricity":      {None: Extractor(("detail", "yearElectricity"))},
+    "totalElectricity":     {None: Extractor(("detail", "totalElectricity"))},
+    "todayGridIncome":      {None: Extractor(("detail", "todayGridIncome"))},
+    "income":               {None: Extractor(("detail", "income"))},
+    "selfUseRate":          {None: Extractor(("detail", "selfUseRate"))},
+    "totalBuyElec":         {None: Extractor(("detail", "totalBuyElec"))},
+    "totalConsumpElec":     {None: Extractor(("detail", "totalConsumpElec"))},
+    "totalSellElec":        {None: Extractor(("detail", "totalSellElec"))},
+    "lastUploadTime":       {None: Extractor(("detail", "lastUploadTime"))},
+    "totalPlantTreeNum":    {None: Extractor(("detail", "totalPlantTreeNum"))},
+    "totalReduceCo2":       {None: Extractor(("detail", "totalReduceCo2"))},
+    "currency":             {None: Extractor(("plant", "currency"))},
+    "plantuid":             {None: Extractor(("plant", "plantuid"))},
+    "plantname":            {None: Extractor(("plant", "plantname"))},
+    "isOnline":             {None: Extractor(("plant", "isOnline"))},
+    "address":              {None: Extractor(("plant", "address"))},
+    "systemPower":          {None: Extractor(("plant", "systempower"))},
+    "peakPower":            {None: Extractor(("peak_power",))},
+    "status":               {None: Extractor(("status",))},
+    "chargeElec":           {"h1": Extractor(("view_bean", "chargeElec"))},
+    "dischargeElec":        {"h1": Extractor(("view_bean", "dischargeElec"))},
+    "batCapcity":           {"h1": Extractor(("device_power", "batCapcity"))},
+    "isStorageAlarm":       {"h1": Extractor(("device_power", "isStorageAlarm"))},
+    "batCurr":              {"h1": Extractor(("device_power", "batCurr"))},
+    "batEnergyPercent":     {"h1": Extractor(("device_power", "batEnergyPercent"))},
+    "batteryDirection":     {"h1": Extractor(("device_power", "batteryDirection"), battery_direction)},
+    "batteryPower":         {"h1": Extractor(("device_power", "batteryPower"))},
+    "gridDirection":        {"h1": Extractor(("device_power", "gridDirection"), power_direction("Grid Direction"))},
+    "gridPower":            {"h1": Extractor(("device_power", "gridPower"))},
+    "h1Online":             {"h1": Extractor(("device_power", "isOnline"), yes_no)},
+    "outPower":             {"h1": Extractor(("device_power", "outPower"))},
+    "outPutDirection":      {"h1": Extractor(("device_power", "outPutDirection"), power_direction("outPut Direction"))},
+    "pvDirection":          {"h1": Extractor(("device_power", "pvDirection"), power_direction("pv Direction"))},
+    "pvPower":              {"h1": Extractor(("device_power", "pvPower"))},
+    "solarPower":           {"h1": Extractor(("device_power", "solarPower"))},
+    "pvElec": {
+        "h1":      Extractor(("view_bean", "pvElec")),
+        "saj_sec": Extractor(("meter_view_bean", "pvElec")),
+    },
+    "useElec": {
+        "h1":      Extractor(("view_bean", "useElec")),
+        "saj_sec": Extractor(("meter_view_bean", "useElec")),
+    },
+    "buyElec": {
+        "h1":      Extractor(("view_bean", "buyElec")),
+        "saj_sec": Extractor(("meter_view_bean", "buyElec")),
+    },
+    "sellElec": {
+        "h1":      Extractor(("view_bean", "sellElec")),
+        "saj_sec": Extractor(("meter_view_bean", "sellElec")),
+    },
+    "buyRate": {
+        "h1":      Extractor(("view_bean", "buyRate")),
+        "saj_sec": Extractor(("meter_view_bean", "buyRate")),
+    },
+    "sellRate": {
+        "h1":      Extractor(("view_bean", "sellRate")),
+        "saj_sec": Extractor(("meter_view_bean", "sellRate")),
+    },
+    "selfConsumedRate1": {
+        "h1":      Extractor(("view_bean", "selfConsumedRate1")),
+        "saj_sec": Extractor(("meter_view_bean", "selfConsumedRate1")),
+    },
+    "selfConsumedRate2": {
+        "h1":      Extractor(("view_bean", "selfConsumedRate2")),
+        "saj_sec": Extractor(("meter_view_bean", "selfConsumedRate2")),
+    },
+    "selfConsumedEnergy1": {
+        "h1":      Extractor(("view_bean", "selfConsumedEnergy1")),
+        "saj_sec": Extractor(("meter_view_bean", "selfConsumedEnergy1")),
+    },
+    "selfConsumedEnergy2": {
+        "h1":      Extractor(("view_bean", "selfConsumedEnergy2")),
+        "saj_sec": Extractor(("meter_view_bean", "selfConsumedEnergy2")),
+    },
+    "totalLoadPower": {
+        "h1":      Extractor(("device_power", "totalLoadPower")),
+        # deprecated for saj_sec since it uses the wrong column
+        "saj_sec": Extractor(("meter_curves", 2), last_sample),
+    },
+    "reduceCo2":            {"saj_sec": Extractor(("meter_view_bean", "reduceCo2"))},
+    "plantTreeNum":         {"saj_sec": Extractor(("meter_view_bean", "plantTreeNum"))},
+    # dataCountList, deprecated since use the wrong columns
+    "totalGridPower":       {"saj_sec": Extractor(("meter_curves", 3), last_sample)},
+    "totalPvgenPower":      {"saj_sec": Extractor(("meter_curves", 4), last_sample)},
+    # intraday curves, the latest sample with a value
+    "homeLoadPower":        {"saj_sec": Extractor(("meter_curves", 1), last_sample)},
+    "solarLoadPower":       {"saj_sec": Extractor(("meter_curves", 2), last_sample)},
+    "exportPower":          {"saj_sec": Extractor(("meter_curves", 3), last_sample)},
+    "gridLoadPower":        {"saj_sec": Extractor(("meter_curves", 4), last_sample)},
+    "totalPvEnergy":        {"saj_sec": Extractor(("meter_detail", "totalPvEnergy"))},
+    "totalLoadEnergy":      {"saj_sec": Extractor(("meter_detail", "totalLoadEnergy"))},
+    "totalBuyEnergy":       {"saj_sec": Extractor(("meter_detail", "totalBuyEnergy"))},
+    "totalSellEnergy":      {"saj_sec": Extractor(("meter_detail", "totalSellEnergy"))},
+}
+
+
+# Sensor key -> sensors mode -> extractor of the intraday ChartSeries behind the sensor,
+# the samples that are new since the previous poll are exposed as an attribute
+SENSOR_CURVES = {
+    "homeLoadPower":        {"saj_sec": Extractor(("meter_curves", 1))},
+    "solarLoadPower":       {"saj_sec": Extractor(("meter_curves", 2))},
+    "exportPower":          {"saj_sec": Extractor(("meter_curves", 3))},
+    "gridLoadPower":        {"saj_sec": Extractor(("meter_curves", 4))},
+}
+
+
+# Sensor key -> sensors mode -> extractor of the value of a device, see Extractor.for_device.
+# The live values of an h1 are reported by every storage device.
+DEVICE_EXTRACTORS = {
+    "deviceOnline":         {None: Extractor(("devices", "isOnline"), yes_no)},
+}
+DEVICE_EXTRACTORS.update({
+    key: {"h1": Extractor(("device_powers",) + extractors["h1"].path[1:], extractors["h1"].convert)}
+    for key, extractors in SENSOR_EXTRACTORS.items()
+    if "h1" in extractors and extractors["h1"].path[0] == "device_power"
+})
+
+# Sensor keys that only exist per device
+DEVICE_ONLY_SENSORS = set(DEVICE_EXTRACTORS) - set(SENSOR_EXTRACTORS)
+
+
+def resolve_extractor(key, sensors, registry=SENSOR_EXTRACTORS):
+    """Return the extractor of a sensor key for the sensors mode, or None when it has no value in that mode."""
+    extractors = registry.get(key, {})
+    return extractors.get(sensors, extractors.get(None))
+
+
+# Fetch steps polled whatever the resources: the plant names the entities, its details
+# drive the adaptive polling and the device serial the statistics backfill
+ALWAYS_POLLED = ("plant", "getPlantDetailInfo", "deviceSnArr")
+
+
+# Fields of the responses the fetch plan, the scheduler and the topology read, by fetch step
+STEP_FIELDS = {
+    "getUserPlantList":         (("plantList",),),
+    "getPlantDetailInfo":       (("plantDetail", "snList"), ("plantDetail", "lastUploadTime"), ("plantDetail", "nowPower"), ("plantDetail", "runningState")),
+    "findDevicePageList":       (("list", "devicesn"), ("list", "type"), ("list", "deviceModel"), ("list", "isOnline")),
+    "getPlantMeterModuleList":  (("moduleList", "moduleSn"),),
+    "getPlantMeterChartData":   (("xAxis",), ("dataCountList",)),
+}
+
+
+def resource_steps(resources, sensors):
+    """Return the fetch steps the PlantSnapshot parts read by the sensors of the resources come from."""
+    steps = set()
+    for key in resources:
+        for registry in (SENSOR_EXTRACTORS, SENSOR_CURVES, DEVICE_EXTRACTORS):
+            extractor = resolve_extractor(key, sensors, registry)
+            if extractor is not None:
+                steps.add(SNAPSHOT_PARTS[extractor.path[0]][0])
+    return steps
+
+
+def response_fields(steps):
+    """Return the field tree of the response of every fetch step, from what the snapshot and the plan read."""
+    fields = {}
+    for step in steps:
+        if step.fetch is None:
+            continue
+        tree = {}
+        for path in STEP_FIELDS.get(step.name, ()) + tuple(part_paths(step.name)):
+            add_fields(tree, path)
+        fields[step.name] = tree
+    return fields
+
+def has_source_settings(config):
+    """The portal needs a login, the local source the address of the inverter, the hybrid source both."""
+    if config[CONF_SOURCE] != SOURCE_CLOUD and CONF_LOCAL_HOST not in config:
+        raise vol.Invalid(f"{CONF_LOCAL_HOST} is required for the {config[CONF_SOURCE]} source")
+    if config[CONF_SOURCE] != SOURCE_LOCAL and (CONF_USERNAME not in config or CONF_PASSWORD not in config):
+        raise vol.Invalid(f"{CONF_USERNAME} and {CONF_PASSWORD} are required for the {config[CONF_SOURCE]} source")
+    return config
+
+
+LOCAL_REGISTER_SCHEMA = vol.Schema(
     {
-        vol.Required(CONF_USERNAME): cv.string,
-        vol.Required(CONF_PASSWORD): cv.string,
+        vol.Required("address"): cv.positive_int,
+        vol.Optional("type", default="int16"): vol.In(REGISTER_TYPES),
+        vol.Optional("scale", default=1.0): vol.Coerce(float),
+    }
+)
+
+PLATFORM_SCHEMA = vol.All(PLATFORM_SCHEMA.extend(
+    {
+        vol.Optional(CONF_USERNAME): cv.string,
+        vol.Optional(CONF_PASSWORD): cv.string,
         vol.Required(CONF_RESOURCES, default=list(SENSOR_LIST)): vol.All( # type: ignore
             cv.ensure_list, [vol.In(SENSOR_LIST)]
         ),
         vol.Optional(CONF_SENSORS, default="None"): cv.string, # type: ignore
         vol.Optional(CONF_PLANT_ID, default=0): cv.positive_int, # type: ignore
+        vol.Optional(CONF_ALL_PLANTS, default=False): cv.boolean,
         vol.Optional("provider_domain",default="fop.saj-electric.com"): cv.string,
         vol.Optional("provider_path", default="saj"):cv.string,
         vol.Optional("provider_protocol", default="https"):cv.string,
         vol.Optional("provider_ssl", default=True):cv.boolean,
-
-
+        vol.Optional(CONF_TOPOLOGY_TTL, default=DEFAULT_TOPOLOGY_TTL): cv.time_period,
+        vol.Optional(CONF_PERSIST_TOPOLOGY, default=True): cv.boolean,
+        vol.Optional(CONF_ADAPTIVE_POLLING, default=True): cv.boolean,
+        vol.Optional(CONF_SLOW_SCAN_INTERVAL, default=DEFAULT_SLOW_SCAN_INTERVAL): cv.time_period,
+        vol.Optional(CONF_REQUEST_TIMEOUT, default=DEFAULT_REQUEST_TIMEOUT): cv.time_period,
+        vol.Optional(CONF_ENDPOINT_TIMEOUTS, default={}): vol.Schema({vol.In(PORTAL_ENDPOINTS): cv.time_period}),
+        vol.Optional(CONF_POLL_DEADLINE, default=DEFAULT_POLL_DEADLINE): cv.time_period,
+        vol.Optional(CONF_STALE_AFTER, default=DEFAULT_STALE_AFTER): cv.time_period,
+        vol.Optional(CONF_SOURCE, default=SOURCE_CLOUD): vol.In((SOURCE_CLOUD, SOURCE_LOCAL, SOURCE_HYBRID)),
+        vol.Optional(CONF_LOCAL_HOST): cv.string,
+        vol.Optional(CONF_LOCAL_PORT, default=DEFAULT_PORT): cv.port,
+        vol.Optional(CONF_LOCAL_UNIT, default=DEFAULT_UNIT): cv.positive_int,
+        vol.Optional(CONF_LOCAL_REGISTERS, default={}): vol.Schema({vol.In(SENSOR_LIST): LOCAL_REGISTER_SCHEMA}),
+        vol.Optional(CONF_LOCAL_SCAN_INTERVAL, default=DEFAULT_LOCAL_SCAN_INTERVAL): cv.time_period,
+        vol.Optional(CONF_MIN_UPDATE_INTERVAL, default=DEFAULT_MIN_UPDATE_INTERVAL): cv.time_period,
+        vol.Optional(CONF_SOURCE_PRIORITY, default={}): vol.Schema({vol.In(SENSOR_LIST): vol.In((SOURCE_LOCAL, SOURCE_CLOUD))}),
     }
-)
+), has_source_settings)
 
 async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
 
     """Setup the SAJ eSolar sensors."""
 
-    session = async_create_clientsession(hass,verify_ssl=config.get("provider_ssl")) #some providers have broken SSL chains
-    provider= EsolarProvider(config.get("provider_domain"),config.get("provider_path"),config.get("provider_protocol"))
-    data = SAJeSolarMeterData(session, config.get(CONF_USERNAME), config.get(CONF_PASSWORD), config.get(CONF_SENSORS), config.get(CONF_PLANT_ID), provider)
-    await data.async_update()
+    # the local source reads one inverter, so it serves the plant of plant_id
+    all_plants = config.get(CONF_ALL_PLANTS) and config.get(CONF_SOURCE) == SOURCE_CLOUD
+    plant_id = None if all_plants else config.get(CONF_PLANT_ID)
+    plant_key = "all" if all_plants else plant_id
+    update_interval = config.get(CONF_SCAN_INTERVAL, MIN_TIME_BETWEEN_UPDATES)
+    cloud = None
+    if config.get(CONF_SOURCE) == SOURCE_LOCAL:
+        data = local_source(config, plant_key)
+        coordinator = SAJeSolarCoordinator(hass, data, config.get(CONF_LOCAL_SCAN_INTERVAL))
+        target = f"Modbus-TCP {config.get(CONF_LOCAL_HOST)}"
+    elif config.get(CONF_SOURCE) == SOURCE_HYBRID:
+        # live values at local_scan_interval, the portal every scan_interval
+        cloud = await async_cloud_source(hass, config, plant_id, plant_key)
+        local = local_source(config, plant_key, cloud.metrics)
+        priority = {key: SOURCE_LOCAL for key in local.paths}
+        priority.update(config.get(CONF_SOURCE_PRIORITY))
+        data = HybridSource(cloud, local, priority, update_interval)
+        coordinator = SAJeSolarCoordinator(hass, data, config.get(CONF_LOCAL_SCAN_INTERVAL))
+        target = f"eSolar using url: {cloud.provider.getBaseUrl()}"
+    else:
+        data = cloud = await async_cloud_source(hass, config, plant_id, plant_key)
+        scheduler = UploadScheduler(hass, update_interval) if config.get(CONF_ADAPTIVE_POLLING) else None
+        coordinator = SAJeSolarCoordinator(hass, data, update_interval, scheduler)
+        target = f"eSolar using url: {data.provider.getBaseUrl()}"
+    await coordinator.async_refresh()
+    if not coordinator.last_update_success:
+        # we need the plants of the account to create the entities
+        raise PlatformNotReady(f"Cannot poll {target}")
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, data.async_close)
 
     entities = []
-    for description in SENSOR_TYPES:
-        if description.key in config[CONF_RESOURCES]:
-            sensor = SAJeSolarMeterSensor(description, data, config.get(CONF_SENSORS), config.get(CONF_PLANT_ID))
-            entities.append(sensor)
-    async_add_entities(entities, True)
+    for plantuid, plant in coordinator.data.items():
+        plantname = plant.plant.plantname if all_plants else None
+        if cloud is not None:
+            async_register_backfill(hass, StatisticsBackfill(hass, cloud, plantuid, plant.plant.plantname))
+        for description in SENSOR_TYPES:
+            if description.key not in config[CONF_RESOURCES] or description.key in DEVICE_ONLY_SENSORS:
+                continue
+            # the local source only has the values of its registers
+            if cloud is not None or description.key in data.paths:
+                sensor = SAJeSolarMeterSensor(coordinator, description, config.get(CONF_SENSORS), plantuid, plantname)
+                entities.append(sensor)
+        # every device gets the sensors of the values it reports
+        for description in SENSOR_TYPES:
+            extractor = resolve_extractor(description.key, config.get(CONF_SENSORS), DEVICE_EXTRACTORS)
+            if description.key not in config[CONF_RESOURCES] or extractor is None:
+                continue
+            for devicesn, device in (plant.devices or {}).items():
+                if devicesn in (getattr(plant, extractor.path[0]) or {}):
+                    entities.append(SAJeSolarMeterSensor(coordinator, description, config.get(CONF_SENSORS), plantuid, plantname, device))
+    # the metrics are per account, or per inverter of the local source
+    if cloud is not None:
+        metrics_key = f"{cloud.provider.host}_{config.get(CONF_USERNAME)}_{plant_key}"
+    else:
+        metrics_key = f"{config.get(CONF_LOCAL_HOST)}_{plant_key}"
+    entities.append(SAJeSolarMetricSensor(data.metrics, None, metrics_key))
+    for endpoint in sorted(data.endpoints()):
+        entities.append(SAJeSolarMetricSensor(data.metrics, endpoint, metrics_key))
+    async_add_entities(entities)
     return True
 
+
+async def async_cloud_source(hass, config, plant_id, plant_key):
+    """Return the eSolar portal data source of the platform config."""
+    provider= EsolarProvider(config.get("provider_domain"),config.get("provider_path"),config.get("provider_protocol"))
+    esolar = async_get_pool(hass, provider, config.get("provider_ssl")).get_session(config.get(CONF_USERNAME), config.get(CONF_PASSWORD))
+    store = None
+    if config.get(CONF_PERSIST_TOPOLOGY):
+        store = Store(hass, STORAGE_VERSION, f"{DOMAIN}.topology.{slugify(f'{provider.host}_{config.get(CONF_USERNAME)}_{plant_key}')}")
+    topology = TopologyCache(
+        config.get(CONF_TOPOLOGY_TTL), store, f"{config.get(CONF_SENSORS)}:{plant_key}"
+    )
+    await topology.async_load()
+    timeouts = {endpoint: timeout.total_seconds() for endpoint, timeout in config.get(CONF_ENDPOINT_TIMEOUTS).items()}
+    data = SAJeSolarMeterData(
+        esolar, config.get(CONF_SENSORS), plant_id, provider, topology, config.get(CONF_SLOW_SCAN_INTERVAL),
+        config.get(CONF_REQUEST_TIMEOUT), timeouts, config.get(CONF_POLL_DEADLINE), config.get(CONF_STALE_AFTER),
+        config.get(CONF_RESOURCES), config.get(CONF_MIN_UPDATE_INTERVAL),
+    )
+    return data
+
+
+def local_source(config, plant_key, metrics=None):
+    """Return the Modbus-TCP data source of the platform config.
+
+    The configured registers extend or replace the registers of the H1.
+    """
+    registers = dict(H1_REGISTERS)
+    registers.update({key: Register(**register) for key, register in config.get(CONF_LOCAL_REGISTERS).items()})
+    paths = local_paths(config[CONF_RESOURCES], lambda key: resolve_extractor(key, config.get(CONF_SENSORS)))
+    host = config.get(CONF_LOCAL_HOST)
+    client = ModbusClient(host, config.get(CONF_LOCAL_PORT), config.get(CONF_LOCAL_UNIT))
+    return LocalModbusSource(client, registers, paths, f"local_{plant_key}", host, config.get(CONF_STALE_AFTER), metrics)
+
 class EsolarProvider(object):
     """Handless the information of the url of a particular esolar provider (e.g. saj, greenheiss)"""
     def __init__(self,host,path,protocol):
@@ -584,316 +1014,412 @@ class EsolarProvider(object):
 
 
 
-class SAJeSolarMeterData(object):
-    """Handle eSolar object and limit updates."""
+class SAJeSolarMeterData(DataSource):
+    """Handle eSolar object and download the data of the plant, the data source of the eSolar portal."""
+
+    def __init__(
+        self, esolar, sensors, plant_id, provider, topology=None, slow_interval=DEFAULT_SLOW_SCAN_INTERVAL,
+        request_timeout=DEFAULT_REQUEST_TIMEOUT, endpoint_timeouts=None, poll_deadline=DEFAULT_POLL_DEADLINE,
+        stale_after=DEFAULT_STALE_AFTER, resources=None, min_update_interval=DEFAULT_MIN_UPDATE_INTERVAL,
+    ):
+        """Initialize the data object, a plant_id of None polls every plant of the account.
 
-    def __init__(self, session: aiohttp.ClientSession, username, password, sensors, plant_id, provider):
-        """Initialize the data object."""
+        endpoint_timeouts are the seconds a request to an endpoint may take, when it
+        differs from request_timeout. A poll cycle ends after poll_deadline. The last
+        known data of a failing endpoint is served until it failed for stale_after.
+        Only the steps needed by the resources (sensor keys, None for all) are polled.
+        An update within min_update_interval of the previous one serves that one.
+        """
 
-        self._session  = session
         self._provider = provider
-        self.username  = username
-        self.password  = password
+        self._esolar   = esolar
         self.sensors   = sensors
         self.plant_id  = plant_id
+        self._topology = topology or TopologyCache(DEFAULT_TOPOLOGY_TTL)
+        # steps of every plant that failed with an identifier error right after discovery
+        self._identifier_errors = {}
+        self._slow_interval = slow_interval.total_seconds()
+        self._request_timeout   = request_timeout.total_seconds()
+        self._endpoint_timeouts = endpoint_timeouts or {}
+        self._poll_deadline     = poll_deadline.total_seconds()
+        self._stale_after       = stale_after.total_seconds()
+        self.min_update_interval = min_update_interval.total_seconds()
+        self._slow_results  = {}
+        self._slow_updated  = None
+        self._chart_devices = {}
+        # step results and telemetry snapshot of the previous poll by plant, to detect unchanged plants
+        self._results   = {}
+        self._telemetry = {}
+        # last known good results of every plant, and the plant index of every plantuid
+        self._snapshots = {}
+        self._plant_ids = {}
+        self.metrics    = PollMetrics()
+        # request cache of the running poll cycle
+        self._requests  = None
+        self._steps     = None
+        self._fields    = {}
+        plan = self._build_plan(0)
+        if resources is not None:
+            self._steps = plan.select(resource_steps(resources, sensors) | set(ALWAYS_POLLED))
+            _LOGGER.debug("Polling %s for %s", sorted(self._steps), resources)
+        self._fields = response_fields(plan.steps)
+        self._results_day = None
         self._data     = None
 
 
-    @Throttle(MIN_TIME_BETWEEN_UPDATES)
-    async def async_update(self):
-        """Download and update data from SAJeSolar."""
-
-        try:
-
-            today = datetime.date.today()
-            clientDate = today.strftime('%Y-%m-%d')
-
-            # Login to eSolar API
-            url = self._provider.getLoginUrl()
-            payload = {
-                'lang': 'en',
-                'username': self.username,
-                'password': self.password,
-                'rememberMe': 'true'
-            }
-            headers_login = {
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Accept-Language': 'nl-NL,nl;q=0.9,en-US;q=0.8,en;q=0.7',
-                'Cache-Control': 'max-age=0',
-                'Connection': 'keep-alive',
-                'Content-Type': 'application/x-www-form-urlencoded',
-                'Cookie': 'org.springframework.web.servlet.i18n.CookieLocaleResolver.LOCALE=en; op_esolar_lang=en',
-                'DNT': '1',
-                'Host': self._provider.host,
-                'Origin': self._provider.host,
-                'Referer': self._provider.getLoginUrl(),
-                'sec-ch-ua': '" Not;A Brand";v="99", "Google Chrome";v="91", "Chromium";v="91"',
-                'sec-ch-ua-mobile': '?0',
-                'Sec-Fetch-Dest': 'document',
-                'Sec-Fetch-Mode': 'navigate',
-                'Sec-Fetch-Site': 'same-origin',
-                'Sec-Fetch-User': '?1',
-                'Upgrade-Insecure-Requests': '1',
-                'User-Agent'
-                : 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36'
-            }
-            response = await self._session.post(url, headers=headers_login, data=payload)
-
-            if response.status != 200:
-                _LOGGER.error(f"{response.url} returned {response.status}")
-                return
-
-
-            # Get API Plant info from Esolar Portal
-            url2 = f"{self._provider.getBaseUrl()}/monitor/site/getUserPlantList"
-            headers = {
-                'Connection': 'keep-alive',
-                'sec-ch-ua': '" Not;A Brand";v="99", "Google Chrome";v="91", "Chromium";v="91"',
-                'Accept': 'application/json, text/javascript, */*; q=0.01',
-                'DNT': '1',
-                'X-Requested-With': 'XMLHttpRequest',
-                'sec-ch-ua-mobile': '?0',
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.106 Safari/537.36',
-                'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-                'Origin': self._provider.host,
-                'Sec-Fetch-Site': 'same-origin',
-                'Sec-Fetch-Mode': 'cors',
-                'Sec-Fetch-Dest': 'empty',
-                'Referer': f"{self._provider.getBaseUrl()}/monitor/home/index",
-                'Accept-Language': 'nl-NL,nl;q=0.9,en-US;q=0.8,en;q=0.7'
-            }
-
-            payload2= f"pageNo=&pageSize=&orderByIndex=&officeId=&clientDate={clientDate}&runningState=&selectInputType=1&plantName=&deviceSn=&type=&countryCode=&isRename=&isTimeError=&systemPowerLeast=&systemPowerMost="
-            response2 = await self._session.post(url2, headers=headers, data=payload2)
-
-            if response2.status != 200:
-                _LOGGER.error(f"{response2.url} returned {response2.status}")
-                return
-
-            plantInfo = await response2.json()
-            plantuid = plantInfo['plantList'][self.plant_id]['plantuid']
-
-            # Get API Plant Solar Details
-            url3 =  f"{self._provider.getBaseUrl()}/monitor/site/getPlantDetailInfo"
-            payload3= f"plantuid={plantuid}&clientDate={clientDate}"
-
-            response3 = await self._session.post(url3, headers=headers, data=payload3)
-
-            if response3.status != 200:
-                _LOGGER.error(f"{response3.url} returned {response3.status}")
-                return
-
-            plantDetails = await response3.json()
-            #_LOGGER.error(f"PlantDetails: {plantDetails}")
-            plantDetails.update(plantInfo)
-
-            devicesInfoUrl = f"{self._provider.getBaseUrl()}/cloudMonitor/device/findDevicePageList"
-            devicesInfoPayload = f"officeId=&pageNo=&pageSize=&orderName=1&orderType=2&plantuid={plantuid}&deviceStatus=&localDate=&localMonth="
-            deviceInfoReponse = await self._session.post(
-                devicesInfoUrl, headers=headers, data=devicesInfoPayload
-            )
-            if deviceInfoReponse.status != 200:
-                _LOGGER.error(
-                    "{deviceInfoReponse.url} returned {deviceInfoReponse.status}"
-                )
-                return
-
-            devicesInfoData = await deviceInfoReponse.json()
-            plantDetails.update(devicesInfoData)
+    @property
+    def provider(self):
+        return self._provider
+
+    def endpoints(self):
+        """The login and the portal endpoints of the fetch steps, the cached topology may skip some on a poll."""
+        plan = self._build_plan(0)
+        return {"login"} | {STEP_ENDPOINTS.get(step.name, step.name) for step in plan.steps if step.fetch is not None}
+
+    async def async_logout(self, *_):
+        """Logout the kept alive eSolar session."""
+        await self._esolar.async_logout(self.metrics)
+
+    async def async_close(self, *_):
+        await self.async_logout()
+
+    async def _async_fetch(self, endpoint, url, data=None, method="POST"):
+        """Call a portal endpoint with the timeout configured for it, once per poll cycle for the same request."""
+        timeout = self._endpoint_timeouts.get(endpoint, self._request_timeout)
+
+        async def fetch():
+            return await self._esolar.async_request(method, url, data=data, timeout=timeout, metrics=self.metrics)
+
+        if self._requests is None:
+            return await fetch()
+        return await self._requests.async_fetch(request_key(endpoint, url, data), fetch)
+
+    async def _async_get_plant_list(self):
+        """Get API Plant info from Esolar Portal."""
+        clientDate = datetime.date.today().strftime('%Y-%m-%d')
+        payload = f"pageNo=&pageSize=&orderByIndex=&officeId=&clientDate={clientDate}&runningState=&selectInputType=1&plantName=&deviceSn=&type=&countryCode=&isRename=&isTimeError=&systemPowerLeast=&systemPowerMost="
+        return await self._async_fetch("getUserPlantList", f"{self._provider.getBaseUrl()}/monitor/site/getUserPlantList", data=payload)
+
+    async def _async_get_plant_chart(self, plantuid, deviceSnArr, chartDateType, chartDate):
+        """Get the getPlantDetailChart2 chart of the day (1), month (2) or year (3) of chartDate."""
+        clientDate = datetime.date.today().strftime('%Y-%m-%d')
+        previousChartDay = chartDate - datetime.timedelta(days=1)
+        nextChartDay = chartDate + datetime.timedelta(days = 1)
+        chartDay = chartDate.strftime('%Y-%m-%d')
+        previousChartMonth = add_months(chartDate,-1).strftime('%Y-%m')
+        nextChartMonth = add_months(chartDate, 1).strftime('%Y-%m')
+        chartMonth = chartDate.strftime('%Y-%m')
+        previousChartYear = add_years(chartDate, -1).strftime('%Y')
+        nextChartYear = add_years(chartDate, 1).strftime('%Y')
+        chartYear = chartDate.strftime('%Y')
+        epochmilliseconds = round(int((datetime.datetime.utcnow() - datetime.datetime(1970, 1, 1)).total_seconds() * 1000))
+        elecDevicesn = deviceSnArr if self.sensors == "h1" else ""
+        url = f"{self._provider.getBaseUrl()}/monitor/site/getPlantDetailChart2?plantuid={plantuid}&chartDateType={chartDateType}&energyType=0&clientDate={clientDate}&deviceSnArr={deviceSnArr}&chartCountType=2&previousChartDay={previousChartDay}&nextChartDay={nextChartDay}&chartDay={chartDay}&previousChartMonth={previousChartMonth}&nextChartMonth={nextChartMonth}&chartMonth={chartMonth}&previousChartYear={previousChartYear}&nextChartYear={nextChartYear}&chartYear={chartYear}&elecDevicesn={elecDevicesn}&_={epochmilliseconds}"
+        return await self._async_fetch("getPlantDetailChart2", url)
+
+    async def async_get_plant_chart(self, plantuid, chartDateType, chartDate):
+        """Get a past chart of a polled plant, used by the statistics backfill."""
+        if plantuid not in self._chart_devices:
+            raise EsolarError(f"Plant {plantuid} has not been polled yet")
+        return await self._async_get_plant_chart(plantuid, self._chart_devices[plantuid], chartDateType, chartDate)
+
+    def _build_plan(self, plant_id, semaphore=None):
+        """Build the fetch plan of one plant for the configured sensors mode."""
+
+        today = datetime.date.today()
+        clientDate = today.strftime('%Y-%m-%d')
+        previousChartDay = today - datetime.timedelta(days=1)
+        nextChartDay = today + datetime.timedelta(days = 1)
+        chartDay = today.strftime('%Y-%m-%d')
+        previousChartMonth = add_months(today,-1).strftime('%Y-%m')
+        nextChartMonth = add_months(today, 1).strftime('%Y-%m')
+        chartMonth = today.strftime('%Y-%m')
+        previousChartYear = add_years(today, -1).strftime('%Y')
+        nextChartYear = add_years(today, 1).strftime('%Y')
+        chartYear = today.strftime('%Y')
+        epochmilliseconds = round(int((datetime.datetime.utcnow() - datetime.datetime(1970, 1, 1)).total_seconds() * 1000))
+        baseUrl = self._provider.getBaseUrl()
+
+        async def getUserPlantList(results):
+            return await self._async_get_plant_list()
+
+        def plant(results):
+            return results["getUserPlantList"]['plantList'][plant_id]
+
+        def plantuid(results):
+            return results["plant"]['plantuid']
+
+        # Get API Plant Solar Details
+        async def getPlantDetailInfo(results):
+            payload = f"plantuid={results['plantuid']}&clientDate={clientDate}"
+            return await self._async_fetch("getPlantDetailInfo", f"{baseUrl}/monitor/site/getPlantDetailInfo", data=payload)
+
+        async def findDevicePageList(results):
+            payload = f"officeId=&pageNo=&pageSize=&orderName=1&orderType=2&plantuid={results['plantuid']}&deviceStatus=&localDate=&localMonth="
+            return await self._async_fetch("findDevicePageList", f"{baseUrl}/cloudMonitor/device/findDevicePageList", data=payload)
+
+        def deviceSnArr(results):
+            snList = results["getPlantDetailInfo"]["plantDetail"]["snList"]
             if self.sensors == "h1":
-                deviceSnArr = next(
+                return next(
                     (
                         item['devicesn']
-                        for item in plantDetails["list"]
+                        for item in results["findDevicePageList"]["list"]
                         if item["type"] == DEVICE_TYPES["Battery"]
                     ),
-                    plantDetails["plantDetail"]["snList"][0],
+                    snList[0],
                 )
+            return snList[0]
+
+        def devices(results):
+            listed = results["findDevicePageList"].get("list") or []
+            serials = {item.get("devicesn") for item in listed}
+            snList = results["getPlantDetailInfo"]["plantDetail"].get("snList") or []
+            return listed + [{"devicesn": devicesn} for devicesn in snList if devicesn not in serials]
+
+        # getPlantDetailChart2
+        async def getPlantDetailChart2(results):
+            return await self._async_get_plant_chart(results['plantuid'], results['deviceSnArr'], 1, today)
+
+        # H1 Module: getStoreOrAcDevicePowerInfo
+        async def getDevicePower(devicesn):
+            url = f"{baseUrl}/monitor/site/getStoreOrAcDevicePowerInfo?plantuid=&devicesn={devicesn}&_={epochmilliseconds}"
+            return await self._async_fetch("getStoreOrAcDevicePowerInfo", url)
+
+        async def getStoreOrAcDevicePowerInfo(results):
+            return await getDevicePower(results['deviceSnArr'])
+
+        # the storage devices report the live values, the batteries or else the inverters,
+        # fetched concurrently and sharing the call of deviceSnArr
+        async def devicePowerInfo(results):
+            batteries = [item["devicesn"] for item in results["devices"] if item.get("type") == DEVICE_TYPES["Battery"]]
+            serials = batteries or [item["devicesn"] for item in results["devices"] if item.get("type", DEVICE_TYPES["Inverter"]) == DEVICE_TYPES["Inverter"]]
+            responses = await asyncio.gather(*(getDevicePower(devicesn) for devicesn in serials))
+            return {"devices": [dict(response, devicesn=devicesn) for devicesn, response in zip(serials, responses)]}
+
+        # Sec module: getPlantMeterModuleList
+        async def getPlantMeterModuleList(results):
+            payload = f"pageNo=&pageSize=&plantUid={results['plantuid']}"
+            return await self._async_fetch("getPlantMeterModuleList", f"{baseUrl}/cloudmonitor/plantMeterModule/getPlantMeterModuleList", data=payload)
+
+        def moduleSn(results):
+            return results["getPlantMeterModuleList"]['moduleList'][0]['moduleSn']
+
+        def meterCurves(results):
+            chart = results["getPlantMeterChartData"]
+            return [ChartSeries.from_chart(chart, index, today) for index in range(len(chart["dataCountList"]))]
+
+        async def getPlantMeterDetailInfo(results):
+            payload = f"plantuid={results['plantuid']}&clientDate={clientDate}"
+            return await self._async_fetch("getPlantMeterDetailInfo", f"{baseUrl}/monitor/site/getPlantMeterDetailInfo", data=payload)
+
+        # Get Sec Meter details
+        async def getPlantMeterChartData(results):
+            url = f"{baseUrl}/monitor/site/getPlantMeterChartData?plantuid={results['plantuid']}&chartDateType=1&energyType=0&clientDate={clientDate}&deviceSnArr=&chartCountType=2&previousChartDay={previousChartDay}&nextChartDay={nextChartDay}&chartDay={chartDay}&previousChartMonth={previousChartMonth}&nextChartMonth={nextChartMonth}&chartMonth={chartMonth}&previousChartYear={previousChartYear}&nextChartYear={nextChartYear}&chartYear={chartYear}&moduleSn={results['moduleSn']}&_={epochmilliseconds}"
+            return await self._async_fetch("getPlantMeterChartData", url)
+
+        steps = [
+            FetchStep("getPlantDetailInfo", ("plantuid",), fetch=getPlantDetailInfo),
+            FetchStep("getUserPlantList", fetch=getUserPlantList),
+            FetchStep("findDevicePageList", ("plantuid",), fetch=findDevicePageList),
+            FetchStep("getPlantDetailChart2", ("plantuid", "deviceSnArr"), fetch=getPlantDetailChart2, tier=TIER_SLOW),
+            FetchStep("plant", ("getUserPlantList",), derive=plant),
+            FetchStep("plantuid", ("plant",), derive=plantuid),
+            FetchStep("deviceSnArr", ("getPlantDetailInfo", "findDevicePageList") if self.sensors == "h1" else ("getPlantDetailInfo",), derive=deviceSnArr),
+            FetchStep("devices", ("findDevicePageList", "getPlantDetailInfo"), derive=devices),
+        ]
+        if self.sensors == "h1":
+            steps += [
+                FetchStep("getStoreOrAcDevicePowerInfo", ("deviceSnArr",), fetch=getStoreOrAcDevicePowerInfo),
+                FetchStep("devicePowerInfo", ("devices",), fetch=devicePowerInfo),
+            ]
+        if self.sensors == "saj_sec":
+            steps += [
+                FetchStep("getPlantMeterModuleList", ("plantuid",), fetch=getPlantMeterModuleList),
+                FetchStep("getPlantMeterDetailInfo", ("plantuid",), fetch=getPlantMeterDetailInfo, tier=TIER_SLOW),
+                # the last sample of the meter chart is the live power of the Sec module
+                FetchStep("getPlantMeterChartData", ("plantuid", "moduleSn"), fetch=getPlantMeterChartData),
+                FetchStep("moduleSn", ("getPlantMeterModuleList",), derive=moduleSn),
+                FetchStep("meterCurves", ("getPlantMeterChartData",), derive=meterCurves),
+            ]
+        if self._steps is not None:
+            steps = [step for step in steps if step.name in self._steps]
+        for step in steps:
+            step.fields = self._fields.get(step.name)
+        return FetchPlanner(steps, semaphore)
+
+    async def _async_poll(self, topology):
+        """Poll the plants, the same requests of the cycle share one network call."""
+        self._requests = RequestCache()
+        try:
+            return await self._async_poll_plants(topology)
+        finally:
+            self._requests = None
+
+    async def _async_poll_plants(self, topology):
+        """Poll the plants, concurrently and with a single plant list fetch for the account.
+
+        Endpoints that failed, or didn't answer before the poll deadline, keep their last
+        known results.
+        """
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._poll_deadline
+        if topology is None:
+            async with async_timeout.timeout(self._poll_deadline):
+                plantInfo = await self._async_get_plant_list()
+        else:
+            plantInfo = topology["getUserPlantList"]
+        plant_ids = range(len(plantInfo['plantList'])) if self.plant_id is None else (self.plant_id,)
+        if self._results_day != datetime.date.today():
+            # the day charts start over, don't carry yesterday's parsed curves into today
+            self._results_day = datetime.date.today()
+            self._results = {}
+            self._telemetry = {}
+            self._snapshots = {}
+            # yesterday's charts hold yesterday's daily totals, the slow tier is due right away
+            self._slow_results = {}
+            self._slow_updated = None
+        # the tiers this poll fetches, the slow tier after its interval or with fresh identifiers after discovery
+        tiers = {TIER_FAST}
+        if (
+            topology is None
+            or self._slow_updated is None
+            or time.monotonic() - self._slow_updated >= self._slow_interval
+        ):
+            tiers.add(TIER_SLOW)
+
+        async def poll(plant_id):
+            planner = self._build_plan(plant_id, semaphore)
+            seed = {"getUserPlantList": plantInfo}
+            if topology is not None:
+                seed.update(TopologyCache.plant(topology, plant_id))
+            if TIER_SLOW not in tiers:
+                seed.update(self._slow_results.get(plant_id, {}))
+            previous = self._results.get(plant_id)
+            errors = {}
+            results = await planner.async_run(seed, previous, deadline, errors)
+            if "plantuid" not in results:
+                raise errors["plantuid"]
+            failed = {
+                step.name: errors[step.name] for step in planner.steps if step.fetch is not None and step.name in errors
+            }
+            outdated = {
+                name: err for name, err in errors.items()
+                if isinstance(err, IDENTIFIER_ERRORS) and planner.depends_on(name, IDENTIFIER_STEPS)
+            }
+            if topology is None:
+                # these fail with fresh identifiers too, another rediscovery won't fix them
+                self._identifier_errors[plant_id] = set(outdated)
+            for name, err in outdated.items():
+                if topology is not None and name not in self._identifier_errors.get(plant_id, ()):
+                    raise TopologyOutdated(f"plantuid: {results['plantuid']} {name} failed with the cached identifiers: {err!r}") from err
+            if failed and all(step.name in failed for step in planner.steps if step.fetch is not None and step.name not in seed):
+                # nothing could be fetched, fail the poll as a whole
+                raise next(iter(failed.values()))
+            if failed:
+                _LOGGER.warning("plantuid: %s %s failed, keeping their last known data: %s", results["plantuid"], ", ".join(failed), next(iter(failed.values())))
+
+            now = time.time()
+            snapshot = self._snapshots.setdefault(plant_id, EndpointSnapshot(self._stale_after))
+            snapshot.update(planner, results, seed, errors, now)
+            stale_changed = snapshot.refresh(now)
+            good = snapshot.results
+            self._plant_ids[results["plantuid"]] = plant_id
+            # failed slow steps are missing from the seed, so the next poll fetches them
+            self._slow_results[plant_id] = {
+                step.name: results[step.name] for step in planner.steps if step.tier == TIER_SLOW and step.name in results
+            }
+            if "deviceSnArr" in good:
+                self._chart_devices[results["plantuid"]] = good["deviceSnArr"]
+            _LOGGER.debug("plantuid: %s deviceSnArr: %s moduleSn: %s", results["plantuid"], good.get("deviceSnArr"), good.get("moduleSn"))
+            parts = {step for step, path, build in SNAPSHOT_PARTS.values()}
+            if not stale_changed and planner.unchanged(good, previous, parts) and plant_id in self._telemetry:
+                # same responses as the previous poll, keep the snapshot object so the coordinator sees no change
+                _LOGGER.debug("plantuid: %s unchanged since the upload of %s", results["plantuid"], self._telemetry[plant_id].detail and self._telemetry[plant_id].detail.lastUploadTime)
             else:
-                deviceSnArr = plantDetails["plantDetail"]["snList"][0]
-
-
-            # getPlantDetailChart2
-            previousChartDay = today - datetime.timedelta(days=1)
-            nextChartDay = today + datetime.timedelta(days = 1)
-            chartDay = today.strftime('%Y-%m-%d')
-            previousChartMonth = add_months(today,-1).strftime('%Y-%m')
-            nextChartMonth = add_months(today, 1).strftime('%Y-%m')
-            chartMonth = today.strftime('%Y-%m')
-            previousChartYear = add_years(today, -1).strftime('%Y')
-            nextChartYear = add_years(today, 1).strftime('%Y')
-            chartYear = today.strftime('%Y')
-            epochmilliseconds = round(int((datetime.datetime.utcnow() - datetime.datetime(1970, 1, 1)).total_seconds() * 1000))
-            elecDevicesn = deviceSnArr if self.sensors == "h1" else ""
-            url4 = f"{self._provider.getBaseUrl()}/monitor/site/getPlantDetailChart2?plantuid={plantuid}&chartDateType=1&energyType=0&clientDate={clientDate}&deviceSnArr={deviceSnArr}&chartCountType=2&previousChartDay={previousChartDay}&nextChartDay={nextChartDay}&chartDay={chartDay}&previousChartMonth={previousChartMonth}&nextChartMonth={nextChartMonth}&chartMonth={chartMonth}&previousChartYear={previousChartYear}&nextChartYear={nextChartYear}&chartYear={chartYear}&elecDevicesn={elecDevicesn}&_={epochmilliseconds}"
-            # _LOGGER.error(f"PlantCharts URL: {url4}")
-            response4 = await self._session.post(url4, headers=headers)
-
-            if response4.status != 200:
-                _LOGGER.error(f"{response4.url} returned {response4.status}")
-                return
-
-            plantcharts = await response4.json()
-            # _LOGGER.error(f"PlantCharts: {plantcharts}")
-            plantDetails.update(plantcharts)
-
-
-            # H1 Module
-            if self.sensors == "h1":
-                # getStoreOrAcDevicePowerInfo
-                url_getStoreOrAcDevicePowerInfo = f"{self._provider.getBaseUrl()}/monitor/site/getStoreOrAcDevicePowerInfo?plantuid=&devicesn={deviceSnArr}&_={epochmilliseconds}"
-
-                response_getStoreOrAcDevicePowerInfo = await self._session.post(url_getStoreOrAcDevicePowerInfo, headers=headers)
-
-                if response_getStoreOrAcDevicePowerInfo.status != 200:
-                    _LOGGER.error(f"{response_getStoreOrAcDevicePowerInfo.url} returned {response_getStoreOrAcDevicePowerInfo.status}")
-                    return
-
-                result_getStoreOrAcDevicePowerInfo = await response_getStoreOrAcDevicePowerInfo.json()
-                #_LOGGER.error(f"{result_getStoreOrAcDevicePowerInfo}")
-                plantDetails.update(result_getStoreOrAcDevicePowerInfo)
-                _LOGGER.debug(result_getStoreOrAcDevicePowerInfo)
-
-            elif self.sensors == "None":
-                self._data = plantDetails
-            else:
-                # Data = plantdetails
-                self._data = plantDetails
-
-
-
-            # Sec module
-            if self.sensors == "saj_sec":
-
-                # getPlantMeterModuleList
-                url_module = f"{self._provider.getBaseUrl()}/cloudmonitor/plantMeterModule/getPlantMeterModuleList"
-
-                payload_module = f"pageNo=&pageSize=&plantUid={plantuid}"
-
-                response_module = await self._session.post(url_module, headers=headers, data=payload_module)
-
-                if response_module.status != 200:
-                    _LOGGER.error(f"{response_module.url} returned {response_module.status}")
-                    return
-
-                getPlantMeterModuleList = await response_module.json()
-
-                temp_getPlantMeterModuleList = dict()
-                temp_getPlantMeterModuleList["getPlantMeterModuleList"] = getPlantMeterModuleList
-
-                plantDetails.update(temp_getPlantMeterModuleList)
-
-                moduleSn = plantDetails["getPlantMeterModuleList"]['moduleList'][0]['moduleSn']
-
-                # -Debug- Sec module serial number
-                _LOGGER.debug(moduleSn)
-
-                # findDevicePageList
-                url_findDevicePageList = f"{self._provider.getBaseUrl()}/cloudMonitor/device/findDevicePageList"
-
-                payload_findDevicePageList = f"officeId=1&pageNo=&pageSize=&orderName=1&orderType=2&plantuid={plantuid}&deviceStatus=&localDate={chartMonth}&localMonth={chartMonth}"
-
-                response_findDevicePageList = await self._session.post(url_findDevicePageList, headers=headers, data=payload_findDevicePageList)
-
-                if response_findDevicePageList.status != 200:
-                    _LOGGER.error(f"{response_findDevicePageList.url} returned {response_findDevicePageList.status}")
-                    return
-
-                findDevicePageList = await response_findDevicePageList.json()
-
-                temp_findDevicePageList = dict()
-                temp_findDevicePageList["findDevicePageList"] = findDevicePageList
-
-                plantDetails.update(temp_findDevicePageList)
-
-                # getPlantMeterDetailInfo
-                url_getPlantMeterDetailInfo = f"{self._provider.getBaseUrl()}/monitor/site/getPlantMeterDetailInfo"
-
-                payload_getPlantMeterDetailInfo = f"plantuid={plantuid}&clientDate={clientDate}"
-
-                response_getPlantMeterDetailInfo = await self._session.post(url_getPlantMeterDetailInfo, headers=headers, data=payload_getPlantMeterDetailInfo)
-
-                if response_getPlantMeterDetailInfo.status != 200:
-                    _LOGGER.error(f"{response_getPlantMeterDetailInfo.url} returned {response_getPlantMeterDetailInfo.status}")
-                    return
-
-                getPlantMeterDetailInfo = await response_getPlantMeterDetailInfo.json()
-
-                temp_getPlantMeterDetailInfo = dict()
-                temp_getPlantMeterDetailInfo["getPlantMeterDetailInfo"] = getPlantMeterDetailInfo
-
-                plantDetails.update(temp_getPlantMeterDetailInfo)
-
-                # getPlantMeterEnergyPreviewInfo
-                url_getPlantMeterEnergyPreviewInfo = f"{self._provider.getBaseUrl()}/monitor/site/getPlantMeterEnergyPreviewInfo?plantuid={plantuid}&moduleSn={moduleSn}&_={epochmilliseconds}"
-
-                response_getPlantMeterEnergyPreviewInfo = await self._session.get(url_getPlantMeterEnergyPreviewInfo, headers=headers)
+                self._telemetry[plant_id] = PlantSnapshot.from_results(good, snapshot.stale)
+            self._results[plant_id] = good
+            return planner, results
 
-                if response_getPlantMeterEnergyPreviewInfo.status != 200:
-                    _LOGGER.error(f"{response_getPlantMeterEnergyPreviewInfo.url} returned {response_getPlantMeterEnergyPreviewInfo.status}")
-                    return
+        polls = await asyncio.gather(*(poll(plant_id) for plant_id in plant_ids))
+        if TIER_SLOW in tiers:
+            self._slow_updated = time.monotonic()
+        if topology is None:
+            await self._topology.async_update(plantInfo, {plant_id: results for plant_id, (planner, results) in zip(plant_ids, polls)})
+        return {results["plantuid"]: self._telemetry[plant_id] for plant_id, (planner, results) in zip(plant_ids, polls)}
 
-                getPlantMeterEnergyPreviewInfo = await response_getPlantMeterEnergyPreviewInfo.json()
+    async def _async_update_data(self):
+        """Download and update data from SAJeSolar, raises UpdateFailed when that is not possible.
 
-                temp_getPlantMeterEnergyPreviewInfo = dict()
-                temp_getPlantMeterEnergyPreviewInfo["getPlantMeterEnergyPreviewInfo"] = getPlantMeterEnergyPreviewInfo
-
-                plantDetails.update(temp_getPlantMeterEnergyPreviewInfo)
-
-                # Get Sec Meter details
-                url_getPlantMeterChartData = f"{self._provider.getBaseUrl()}/monitor/site/getPlantMeterChartData?plantuid={plantuid}&chartDateType=1&energyType=0&clientDate={clientDate}&deviceSnArr=&chartCountType=2&previousChartDay={previousChartDay}&nextChartDay={nextChartDay}&chartDay={chartDay}&previousChartMonth={previousChartMonth}&nextChartMonth={nextChartMonth}&chartMonth={chartMonth}&previousChartYear={previousChartYear}&nextChartYear={nextChartYear}&chartYear={chartYear}&moduleSn={moduleSn}&_={epochmilliseconds}"
-
-                response_getPlantMeterChartData = await self._session.post(url_getPlantMeterChartData, headers=headers)
-
-                if response_getPlantMeterChartData.status != 200:
-                    _LOGGER.error(f"{response_getPlantMeterChartData.url} returned {response_getPlantMeterChartData.status}")
-                    return
-
-                getPlantMeterChartData = await response_getPlantMeterChartData.json()
-
-                temp_getPlantMeterChartData = dict()
-                temp_getPlantMeterChartData["getPlantMeterChartData"] = getPlantMeterChartData
-
-                plantDetails.update(temp_getPlantMeterChartData)
-
-                # Data = plantdetails including Sec module
-                self._data = plantDetails
-            elif self.sensors == "None":
-                self._data = plantDetails
-            else:
-                # Data = plantdetails Wtihout Sec module
-                self._data = plantDetails
-
-        # Error logging
-        except aiohttp.ClientError:
-            _LOGGER.error("Cannot poll eSolar using url: %s")
-            return
-        except asyncio.TimeoutError:
-            _LOGGER.error("Timeout error occurred while polling eSolar using url: %s")
-            return
-        except Exception as err:
-            _LOGGER.error("Unknown error occurred while polling eSolar: %s", err)
-            self._data = None
-            return
+        The data are the PlantSnapshot of every plant by plantuid. When the poll fails the last
+        known data is served, until all of it is stale.
+        """
 
+        started = time.monotonic()
+        try:
+            self._data = await self._async_update()
+        except UpdateFailed as err:
+            self.metrics.record_cycle(time.monotonic() - started, False)
+            data = self._last_known_data()
+            if data is None:
+                raise
+            _LOGGER.warning("%s, serving the last known data", err)
+            self._data = data
+        else:
+            self.metrics.record_cycle(time.monotonic() - started, True)
 
         # -Debug- Cookies and Data
-        _LOGGER.debug(self._session.cookie_jar.filter_cookies(self._provider.getBaseDomain()))
+        _LOGGER.debug(self._esolar.session.cookie_jar.filter_cookies(self._provider.getBaseDomain()))
         _LOGGER.debug(self._data)
+        return self._data
+
+    def _last_known_data(self):
+        """Record a failed poll for every plant and return their last known data, None when it is all stale."""
+        if not self._data:
+            return None
+        now = time.time()
+        data = {}
+        available = False
+        for plantuid in self._data:
+            plant_id = self._plant_ids[plantuid]
+            snapshot = self._snapshots.get(plant_id)
+            if snapshot is None:
+                continue
+            snapshot.fail(now)
+            if snapshot.refresh(now):
+                self._telemetry[plant_id] = dataclasses.replace(self._telemetry[plant_id], stale=snapshot.stale)
+            data[plantuid] = self._telemetry[plant_id]
+            available = available or snapshot.stale != set(snapshot.failed)
+        return data if available else None
+
+    def source(self, plantuid, path):
+        snapshot = self._snapshots.get(self._plant_ids.get(plantuid))
+        return snapshot.source(path[0]) if snapshot is not None else None
+
+    async def _async_update(self):
+        """Poll the portal, rediscovering the plants when the cached topology is outdated."""
 
+        try:
+            # skip discovery while the cached topology is valid
+            topology = self._topology.get()
+            try:
+                return await self._async_poll(topology)
+            except TopologyOutdated as err:
+                # A stale plantuid / device serial makes the telemetry calls fail, rediscover once
+                _LOGGER.debug("Poll with cached topology failed (%s), rediscovering plants", err)
+                self._topology.invalidate()
+                return await self._async_poll(None)
 
-        # logout session
-        url_logout =  f"{self._provider.getBaseUrl()}/logout"
-        response_logout = await self._session.post(url_logout, headers=headers)
-
-        if response_logout.status != 200:
-            _LOGGER.error(f"{response_logout.url} returned {response_logout.status}")
-            return
-
-
-        # Clear session and cookies
-        self._session.cookie_jar.clear()
+        # Error logging
+        except EsolarError as err:
+            raise UpdateFailed(str(err)) from err
+        except aiohttp.ClientError as err:
+            raise UpdateFailed(f"Cannot poll eSolar using url: {self._provider.getBaseUrl()}") from err
+        except asyncio.TimeoutError as err:
+            raise UpdateFailed(f"Timeout error occurred while polling eSolar using url: {self._provider.getBaseUrl()}") from err
+        except Exception as err:
+            raise UpdateFailed(f"Unknown error occurred while polling eSolar: {err}") from err
 
     @property
     def latest_data(self):
@@ -904,383 +1430,143 @@ class SAJeSolarMeterData(object):
         _LOGGER.error("return data NONE")
         return None
 
-class SAJeSolarMeterSensor(SensorEntity):
+class SAJeSolarMeterSensor(CoordinatorEntity, SensorEntity):
     """Collecting data and return sensor entity."""
 
-    def __init__(self, description: SensorEntityDescription, data, sensors, plant_id):
-        """Initialize the sensor."""
+    def __init__(self, coordinator, description: SensorEntityDescription, sensors, plantuid, plantname=None, device=None):
+        """Initialize the sensor, a plantname namespaces the entity to its plant and a Device makes it report that device."""
+        super().__init__(coordinator)
         self.entity_description = description
-        self._data = data
 
         self._state = None
         self.sensors = sensors
-        self.plant_id = plant_id
+        self.plantuid = plantuid
         self._type = self.entity_description.key
+        self._extractor = resolve_extractor(self._type, sensors)
+        self._curve_extractor = resolve_extractor(self._type, sensors, SENSOR_CURVES)
+        self._curve = None
+        self._attr_extra_state_attributes = None
+        self._source = None
+        self._available = True
         self._attr_icon = self.entity_description.icon
         self._attr_name = f"{SENSOR_PREFIX}{self.entity_description.name}"
         self._attr_state_class = self.entity_description.state_class
         self._attr_native_unit_of_measurement = self.entity_description.native_unit_of_measurement
         self._attr_device_class = self.entity_description.device_class
         self._attr_unique_id = f"{SENSOR_PREFIX}_{self._type}"
+        if plantname is not None:
+            self._attr_name = f"{SENSOR_PREFIX}{plantname} {self.entity_description.name}"
+            self._attr_unique_id = f"{SENSOR_PREFIX}_{plantuid}_{self._type}"
+        if device is not None:
+            self._extractor = resolve_extractor(self._type, sensors, DEVICE_EXTRACTORS).for_device(device.devicesn)
+            self._curve_extractor = None
+            self._attr_name = f"{SENSOR_PREFIX}{device.devicesn} {self.entity_description.name}"
+            self._attr_unique_id = f"{SENSOR_PREFIX}_{device.devicesn}_{self._type}"
+            self._attr_device_info = DeviceInfo(
+                identifiers={(DOMAIN, device.devicesn)},
+                manufacturer="SAJ",
+                model=device.deviceModel,
+                name=f"{DEVICE_TYPES.get(device.type, 'Device')} {device.devicesn}",
+            )
 
         self._discovery = False
         self._dev_id = {}
+        self._update_state()
 
     @property
     def state(self):
         """Return the state of the sensor. (total/current power consumption/production or total gas used)"""
         return self._state
 
-    async def async_update(self):
-        """Get the latest data and use it to update our sensor state."""
+    @property
+    def available(self):
+        """Return False once the endpoint behind the sensor failed for longer than the staleness limit."""
+        return self._available
 
-        await self._data.async_update()
-        energy = self._data.latest_data
+    @property
+    def extra_state_attributes(self):
+        """Return the curve samples, and the endpoint and fetch time of the data behind the sensor."""
+        attributes = dict(self._attr_extra_state_attributes or {})
+        if self._source is not None:
+            attributes[ATTR_SOURCE_ENDPOINT] = self._source.endpoint
+            attributes[ATTR_LAST_FETCHED] = dt.utc_from_timestamp(self._source.fetched).isoformat() if self._source.fetched else None
+        return attributes or None
+
+    def _update_state(self):
+        """Read our sensor state from the latest coordinator snapshot."""
+        energy = (self.coordinator.data or {}).get(self.plantuid)
 
         if energy:
-            if self._type == 'devOnlineNum':
-                if 'devOnlineNum' in energy['plantDetail']:
-                    if energy['plantDetail']["devOnlineNum"] is not None:
-                        self._state = "Yes" if int(energy['plantDetail']["devOnlineNum"]) else "No"
-            if self._type == 'nowPower':
-                if 'nowPower' in energy['plantDetail']:
-                    if energy['plantDetail']["nowPower"] is not None:
-                        self._state = float(energy['plantDetail']["nowPower"])
-            if self._type == 'runningState':
-                if 'runningState' in energy['plantDetail']:
-                    if energy['plantDetail']["runningState"] is not None:
-                        self._state = "Yes" if int(energy['plantDetail']["runningState"]) else "No"
-            if self._type == 'todayElectricity':
-                if 'todayElectricity' in energy['plantDetail']:
-                    if energy['plantDetail']["todayElectricity"] is not None:
-                        self._state = float(energy['plantDetail']["todayElectricity"])
-            if self._type == 'monthElectricity':
-                if 'monthElectricity' in energy['plantDetail']:
-                    if energy['plantDetail']["monthElectricity"] is not None:
-                        self._state = float(energy['plantDetail']["monthElectricity"])
-            if self._type == 'yearElectricity':
-                if 'yearElectricity' in energy['plantDetail']:
-                    if energy['plantDetail']["yearElectricity"] is not None:
-                        self._state = float(energy['plantDetail']["yearElectricity"])
-            if self._type == 'totalElectricity':
-                if 'totalElectricity' in energy['plantDetail']:
-                    if energy['plantDetail']["totalElectricity"] is not None:
-                        self._state = float(energy['plantDetail']["totalElectricity"])
-            if self._type == 'todayGridIncome':
-                if 'todayGridIncome' in energy['plantDetail']:
-                    if energy['plantDetail']["todayGridIncome"] is not None:
-                        self._state = float(energy['plantDetail']["todayGridIncome"])
-            if self._type == 'income':
-                if 'income' in energy['plantDetail']:
-                    if energy['plantDetail']["income"] is not None:
-                        self._state = float(energy['plantDetail']["income"])
-            if self._type == 'selfUseRate':
-                if 'selfUseRate' in energy['plantDetail']:
-                    if energy['plantDetail']["selfUseRate"] is not None:
-                        self._state = energy['plantDetail']["selfUseRate"]
-            if self._type == 'totalBuyElec':
-                if 'totalBuyElec' in energy['plantDetail']:
-                    if energy['plantDetail']["totalBuyElec"] is not None:
-                        self._state = float(energy['plantDetail']["totalBuyElec"])
-            if self._type == 'totalConsumpElec':
-                if 'totalConsumpElec' in energy['plantDetail']:
-                    if energy['plantDetail']["totalConsumpElec"] is not None:
-                        self._state = float(energy['plantDetail']["totalConsumpElec"])
-            if self._type == 'totalSellElec':
-                if 'totalSellElec' in energy['plantDetail']:
-                    if energy['plantDetail']["totalSellElec"] is not None:
-                        self._state = float(energy['plantDetail']["totalSellElec"])
-            if self._type == 'lastUploadTime':
-                if 'lastUploadTime' in energy['plantDetail']:
-                    if energy['plantDetail']["lastUploadTime"] is not None:
-                        self._state = (energy['plantDetail']["lastUploadTime"])
-            if self._type == 'totalPlantTreeNum':
-                if 'totalPlantTreeNum' in energy['plantDetail']:
-                    if energy['plantDetail']["totalPlantTreeNum"] is not None:
-                        self._state = (energy['plantDetail']["totalPlantTreeNum"])
-            if self._type == 'totalReduceCo2':
-                if 'totalReduceCo2' in energy['plantDetail']:
-                    if energy['plantDetail']["totalReduceCo2"] is not None:
-                        self._state = (energy['plantDetail']["totalReduceCo2"])
-
-            if self._type == 'currency':
-                if 'currency' in energy['plantList'][self.plant_id]:
-                    if energy['plantList'][self.plant_id]["currency"] is not None:
-                        self._state = (energy['plantList'][self.plant_id]["currency"])
-            if self._type == 'plantuid':
-                if 'plantuid' in energy['plantList'][self.plant_id]:
-                    if energy['plantList'][self.plant_id]["plantuid"] is not None:
-                        self._state = (energy['plantList'][self.plant_id]["plantuid"])
-            if self._type == 'plantname':
-                if 'plantname' in energy['plantList'][self.plant_id]:
-                    if energy['plantList'][self.plant_id]["plantname"] is not None:
-                        self._state = (energy['plantList'][self.plant_id]["plantname"])
-            if self._type == 'currency':
-                if 'currency' in energy['plantList'][self.plant_id]:
-                    if energy['plantList'][self.plant_id]["currency"] is not None:
-                        self._state = (energy['plantList'][self.plant_id]["currency"])
-            if self._type == 'isOnline':
-                if 'isOnline' in energy['plantList'][self.plant_id]:
-                    if energy['plantList'][self.plant_id]["isOnline"] is not None:
-                        self._state = (energy['plantList'][self.plant_id]["isOnline"])
-            if self._type == 'address':
-                if 'address' in energy['plantList'][self.plant_id]:
-                    if energy['plantList'][self.plant_id]["address"] is not None:
-                        self._state = (energy['plantList'][self.plant_id]["address"])
-            if self._type == 'systemPower':
-                if 'systempower' in energy['plantList'][self.plant_id]:
-                    if energy['plantList'][self.plant_id]["systempower"] is not None:
-                        self._state = (energy['plantList'][self.plant_id]["systempower"])
-
-            if self._type == 'peakPower':
-                if 'peakPower' in energy:
-                    if energy["peakPower"] is not None:
-                        self._state = float(energy["peakPower"])
-            if self._type == 'status':
-                if 'status' in energy:
-                    if energy["status"] is not None:
-                        self._state = (energy["status"])
-
-            ########################################################################## SAJ h1
-            if self.sensors == "h1":
-                if self._type == 'chargeElec':
-                    if 'chargeElec' in energy['viewBean']:
-                        if energy['viewBean']["chargeElec"] is not None:
-                            self._state = float(energy['viewBean']["chargeElec"])
-                if self._type == 'dischargeElec':
-                    if 'dischargeElec' in energy['viewBean']:
-                        if energy['viewBean']["dischargeElec"] is not None:
-                            self._state = float(energy['viewBean']["dischargeElec"])
-                if self._type == 'buyElec':
-                    if 'pvElec' in energy['viewBean']:
-                        if energy['viewBean']["buyElec"] is not None:
-                            self._state = float(energy['viewBean']["buyElec"])
-                if self._type == 'buyRate':
-                    if 'buyRate' in energy['viewBean']:
-                        if energy['viewBean']["buyRate"] is not None:
-                            self._state = energy['viewBean']["buyRate"]
-                if self._type == 'pvElec':
-                    if 'pvElec' in energy['viewBean']:
-                        if energy['viewBean']["pvElec"] is not None:
-                            self._state = float(energy['viewBean']["pvElec"])
-                if self._type == 'selfConsumedEnergy1':
-                    if 'selfConsumedEnergy1' in energy['viewBean']:
-                        if energy['viewBean']["selfConsumedEnergy1"] is not None:
-                            self._state = float(energy['viewBean']["selfConsumedEnergy1"])
-                if self._type == 'selfConsumedEnergy2':
-                    if 'selfConsumedEnergy2' in energy['viewBean']:
-                        if energy['viewBean']["selfConsumedEnergy2"] is not None:
-                            self._state = float(energy['viewBean']["selfConsumedEnergy2"])
-                if self._type == 'selfConsumedRate1':
-                    if 'selfConsumedRate1' in energy['viewBean']:
-                        if energy['viewBean']["selfConsumedRate1"] is not None:
-                            self._state = energy['viewBean']["selfConsumedRate1"]
-                if self._type == 'selfConsumedRate2':
-                    if 'selfConsumedRate2' in energy['viewBean']:
-                        if energy['viewBean']["selfConsumedRate2"] is not None:
-                            self._state = energy['viewBean']["selfConsumedRate2"]
-                if self._type == 'sellElec':
-                    if 'sellElec' in energy['viewBean']:
-                        if energy['viewBean']["sellElec"] is not None:
-                            self._state = float(energy['viewBean']["sellElec"])
-                if self._type == 'sellRate':
-                    if 'sellRate' in energy['viewBean']:
-                        if energy['viewBean']["sellRate"] is not None:
-                            self._state = energy['viewBean']["sellRate"]
-                if self._type == 'useElec':
-                    if 'useElec' in energy['viewBean']:
-                        if energy['viewBean']["useElec"] is not None:
-                            self._state = float(energy['viewBean']["useElec"])
-                # storeDevicePower
-                if self._type == 'batCapcity':
-                    if 'batCapcity' in energy["storeDevicePower"]:
-                        if energy["storeDevicePower"]['batCapcity'] is not None:
-                            self._state = float(energy["storeDevicePower"]["batCapcity"])
-                if self._type == 'isStorageAlarm':
-                    if 'isStorageAlarm' in energy["storeDevicePower"]:
-                        if energy["storeDevicePower"]['isStorageAlarm'] is not None:
-                            self._state = int(energy["storeDevicePower"]["isStorageAlarm"])
-                if self._type == 'batCurr':
-                    if 'batCurr' in energy["storeDevicePower"]:
-                        if energy["storeDevicePower"]['batCurr'] is not None:
-                            self._state = float(energy["storeDevicePower"]["batCurr"])
-                if self._type == 'batEnergyPercent':
-                    if 'batEnergyPercent' in energy["storeDevicePower"]:
-                        if energy["storeDevicePower"]['batEnergyPercent'] is not None:
-                            self._state = float(energy["storeDevicePower"]["batEnergyPercent"])
-                if self._type == 'batteryDirection':
-                    if 'batteryDirection' in energy["storeDevicePower"]:
-                        if energy["storeDevicePower"]['batteryDirection'] is not None:
-                            if energy["storeDevicePower"]["batteryDirection"] == 0:
-                                self._state = "Standby"
-                            elif energy["storeDevicePower"]["batteryDirection"] == 1:
-                                self._state = "Discharging"
-                            elif energy["storeDevicePower"]["batteryDirection"] == -1:
-                                self._state = "Charging"
-                            else:
-                                self._state = f'Unknown: {energy["storeDevicePower"]["batteryDirection"]}'
-                if self._type == 'batteryPower':
-                    if 'batteryPower' in energy["storeDevicePower"]:
-                        if energy["storeDevicePower"]['batteryPower'] is not None:
-                            self._state = float(energy["storeDevicePower"]["batteryPower"])
-                if self._type == 'gridDirection':
-                    if 'gridDirection' in energy["storeDevicePower"]:
-                        if energy["storeDevicePower"]['gridDirection'] is not None:
-                            if energy["storeDevicePower"]["gridDirection"] == 1:
-                                self._state = "Exporting"
-                            elif energy["storeDevicePower"]["gridDirection"] == -1:
-                                self._state = "Importing"
-                            else:
-                                self._state = energy["storeDevicePower"]["gridDirection"]
-                                _LOGGER.error(f"Grid Direction unknown value: {self._state}")
-                if self._type == 'gridPower':
-                    if 'gridPower' in energy["storeDevicePower"]:
-                        if energy["storeDevicePower"]['gridPower'] is not None:
-                            self._state = float(energy["storeDevicePower"]["gridPower"])
-                if self._type == 'h1Online':
-                    if 'isOnline' in energy["storeDevicePower"]:
-                        if energy["storeDevicePower"]['isOnline'] is not None:
-                            self._state = "Yes" if int(energy['storeDevicePower']["isOnline"]) else "No"
-                if self._type == 'outPower':
-                    if 'outPower' in energy["storeDevicePower"]:
-                        if energy["storeDevicePower"]['outPower'] is not None:
-                            self._state = float(energy["storeDevicePower"]["outPower"])
-                if self._type == 'outPutDirection':
-                    if 'outPutDirection' in energy["storeDevicePower"]:
-                        if energy["storeDevicePower"]['outPutDirection'] is not None:
-                            if energy["storeDevicePower"]["outPutDirection"] == 1:
-                                self._state = "Exporting"
-                            elif energy["storeDevicePower"]["outPutDirection"] == -1:
-                                self._state = "Importing"
-                            else:
-                                self._state = energy["storeDevicePower"]["outPutDirection"]
-                                _LOGGER.error(f"outPut Direction unknown value: {self._state}")
-                if self._type == 'pvDirection':
-                    if 'pvDirection' in energy["storeDevicePower"]:
-                        if energy["storeDevicePower"]['pvDirection'] is not None:
-                            if energy["storeDevicePower"]["pvDirection"] == 1:
-                                self._state = "Exporting"
-                            elif energy["storeDevicePower"]["pvDirection"] == -1:
-                                self._state = "Importing"
-                            else:
-                                self._state = energy["storeDevicePower"]["pvDirection"]
-                                _LOGGER.error(f"pv Direction unknown value: {self._state}")
-                if self._type == 'pvPower':
-                    if 'pvPower' in energy["storeDevicePower"]:
-                        if energy["storeDevicePower"]['pvPower'] is not None:
-                            self._state = float(energy["storeDevicePower"]["pvPower"])
-                if self._type == 'solarPower':
-                    if 'solarPower' in energy["storeDevicePower"]:
-                        if energy["storeDevicePower"]['solarPower'] is not None:
-                            self._state = float(energy["storeDevicePower"]["solarPower"])
-                if self._type == 'totalLoadPower':
-                    if 'totalLoadPower' in energy["storeDevicePower"]:
-                        if energy["storeDevicePower"]['totalLoadPower'] is not None:
-                            self._state = float(energy["storeDevicePower"]['totalLoadPower'])
-
-            ########################################################################## Sec module Sensors:
-            if self.sensors == "saj_sec":
-                # getPlantMeterChartData - viewBeam
-                if self._type == 'pvElec':
-                    if 'pvElec' in energy["getPlantMeterChartData"]['viewBean']:
-                        if energy["getPlantMeterChartData"]['viewBean']["pvElec"] is not None:
-                            self._state = float(energy["getPlantMeterChartData"]['viewBean']["pvElec"])
-                if self._type == 'useElec':
-                    if 'useElec' in energy["getPlantMeterChartData"]['viewBean']:
-                        if energy["getPlantMeterChartData"]['viewBean']["useElec"] is not None:
-                            self._state = float(energy["getPlantMeterChartData"]['viewBean']["useElec"])
-                if self._type == 'buyElec':
-                    if 'buyElec' in energy["getPlantMeterChartData"]['viewBean']:
-                        if energy["getPlantMeterChartData"]['viewBean']["buyElec"] is not None:
-                            self._state = float(energy["getPlantMeterChartData"]['viewBean']["buyElec"])
-                if self._type == 'sellElec':
-                    if 'sellElec' in energy["getPlantMeterChartData"]['viewBean']:
-                        if energy["getPlantMeterChartData"]['viewBean']["sellElec"] is not None:
-                            self._state = float(energy["getPlantMeterChartData"]['viewBean']["sellElec"])
-                if self._type == 'selfConsumedEnergy1':
-                    if 'selfConsumedEnergy1' in energy["getPlantMeterChartData"]['viewBean']:
-                        if energy["getPlantMeterChartData"]['viewBean']["selfConsumedEnergy1"] is not None:
-                            self._state = float(energy["getPlantMeterChartData"]['viewBean']["selfConsumedEnergy1"])
-                if self._type == 'selfConsumedEnergy2':
-                    if 'selfConsumedEnergy2' in energy["getPlantMeterChartData"]['viewBean']:
-                        if energy["getPlantMeterChartData"]['viewBean']["selfConsumedEnergy2"] is not None:
-                            self._state = float(energy["getPlantMeterChartData"]['viewBean']["selfConsumedEnergy2"])
-                if self._type == 'reduceCo2':
-                    if 'reduceCo2' in energy["getPlantMeterChartData"]['viewBean']:
-                        if energy["getPlantMeterChartData"]['viewBean']["reduceCo2"] is not None:
-                            self._state = float(energy["getPlantMeterChartData"]['viewBean']["reduceCo2"])
-                if self._type == 'buyRate':
-                    if 'buyRate' in energy["getPlantMeterChartData"]['viewBean']:
-                        if energy["getPlantMeterChartData"]['viewBean']["buyRate"] is not None:
-                            self._state = (energy["getPlantMeterChartData"]['viewBean']["buyRate"])
-                if self._type == 'sellRate':
-                    if 'sellRate' in energy["getPlantMeterChartData"]['viewBean']:
-                        if energy["getPlantMeterChartData"]['viewBean']["sellRate"] is not None:
-                            self._state = (energy["getPlantMeterChartData"]['viewBean']["sellRate"])
-                if self._type == 'selfConsumedRate1':
-                    if 'selfConsumedRate1' in energy["getPlantMeterChartData"]['viewBean']:
-                        if energy["getPlantMeterChartData"]['viewBean']["selfConsumedRate1"] is not None:
-                            self._state = (energy["getPlantMeterChartData"]['viewBean']["selfConsumedRate1"])
-                if self._type == 'selfConsumedRate2':
-                    if 'selfConsumedRate2' in energy["getPlantMeterChartData"]['viewBean']:
-                        if energy["getPlantMeterChartData"]['viewBean']["selfConsumedRate2"] is not None:
-                            self._state = (energy["getPlantMeterChartData"]['viewBean']["selfConsumedRate2"])
-                if self._type == 'plantTreeNum':
-                    if 'plantTreeNum' in energy["getPlantMeterChartData"]['viewBean']:
-                        if energy["getPlantMeterChartData"]['viewBean']["plantTreeNum"] is not None:
-                            self._state = (energy["getPlantMeterChartData"]['viewBean']["plantTreeNum"])
-
-
-                # dataCountList, deprecated since use the wrong columns
-                if self._type == 'totalGridPower':
-                    if 'dataCountList' in energy:
-                        if energy["getPlantMeterChartData"]['dataCountList'][3][-1] is not None:
-                            self._state = float(energy["getPlantMeterChartData"]['dataCountList'][3][-1])
-                if self._type == 'totalLoadPower':
-                    if 'dataCountList' in energy:
-                        if energy["getPlantMeterChartData"]['dataCountList'][2][-1] is not None:
-                            self._state = float(energy["getPlantMeterChartData"]['dataCountList'][2][-1])
-                if self._type == 'totalPvgenPower':
-                    if 'dataCountList' in energy:
-                        if energy["getPlantMeterChartData"]['dataCountList'][4][-1] is not None:
-                            self._state = float(energy["getPlantMeterChartData"]['dataCountList'][4][-1])
-
-                #dataCountList, new entities
-                if self._type == 'homeLoadPower':
-                    if 'dataCountList' in energy:
-                        if energy["getPlantMeterChartData"]['dataCountList'][1][-1] is not None:
-                            self._state = float(energy["getPlantMeterChartData"]['dataCountList'][1][-1])
-                if self._type == 'solarLoadPower':
-                    if 'dataCountList' in energy:
-                        if energy["getPlantMeterChartData"]['dataCountList'][2][-1] is not None:
-                            self._state = float(energy["getPlantMeterChartData"]['dataCountList'][2][-1])
-                if self._type == 'exportPower':
-                    if 'dataCountList' in energy:
-                        if energy["getPlantMeterChartData"]['dataCountList'][3][-1] is not None:
-                            self._state = float(energy["getPlantMeterChartData"]['dataCountList'][3][-1])
-                if self._type == 'gridLoadPower':
-                    if 'dataCountList' in energy:
-                        if energy["getPlantMeterChartData"]['dataCountList'][4][-1] is not None:
-                            self._state = float(energy["getPlantMeterChartData"]['dataCountList'][4][-1])
-
-                # getPlantMeterDetailInfo
-                if self._type == 'totalPvEnergy':
-                    if 'totalPvEnergy' in energy["getPlantMeterDetailInfo"]['plantDetail']:
-                        if energy["getPlantMeterDetailInfo"]['plantDetail']["totalPvEnergy"] is not None:
-                            self._state = (energy["getPlantMeterDetailInfo"]['plantDetail']["totalPvEnergy"])
-                if self._type == 'totalLoadEnergy':
-                    if 'totalLoadEnergy' in energy["getPlantMeterDetailInfo"]['plantDetail']:
-                        if energy["getPlantMeterDetailInfo"]['plantDetail']["totalLoadEnergy"] is not None:
-                            self._state = (energy["getPlantMeterDetailInfo"]['plantDetail']["totalLoadEnergy"])
-                if self._type == 'totalBuyEnergy':
-                    if 'totalBuyEnergy' in energy["getPlantMeterDetailInfo"]['plantDetail']:
-                        if energy["getPlantMeterDetailInfo"]['plantDetail']["totalBuyEnergy"] is not None:
-                            self._state = (energy["getPlantMeterDetailInfo"]['plantDetail']["totalBuyEnergy"])
-                if self._type == 'totalSellEnergy':
-                    if 'totalSellEnergy' in energy["getPlantMeterDetailInfo"]['plantDetail']:
-                        if energy["getPlantMeterDetailInfo"]['plantDetail']["totalSellEnergy"] is not None:
-                            self._state = (energy["getPlantMeterDetailInfo"]['plantDetail']["totalSellEnergy"])
-
+            extractor = self._extractor or self._curve_extractor
+            if extractor is not None:
+                self._source = self.coordinator.esolar.source(self.plantuid, extractor.path)
+                self._available = self._source is None or not self._source.stale
+
+            if self._extractor is not None:
+                value = self._extractor.extract(energy)
+                if value is not None:
+                    self._state = value
+
+            if self._curve_extractor is not None:
+                curve = self._curve_extractor.extract(energy)
+                if curve is not None and curve is not self._curve:
+                    samples = curve.since(self._curve)
+                    self._curve = curve
+                    self._attr_extra_state_attributes = {ATTR_SAMPLES: [(timestamp.isoformat(), value) for timestamp, value in samples]}
 
             # -Debug- adding sensor
             _LOGGER.debug(f"Device: {self._type} State: {self._state}")
+
+    @callback
+    def _handle_coordinator_update(self):
+        """Handle updated data from the coordinator, only writing the state when ours changed."""
+        written = self._written()
+        self._update_state()
+        if self._written() != written:
+            self.async_write_ha_state()
+
+    def _written(self):
+        """Return what the state write of the sensor depends on, a fetch that didn't change our value doesn't write."""
+        endpoint = self._source.endpoint if self._source is not None else None
+        return (self._state, self._attr_extra_state_attributes, endpoint, self._available)
+
+
+class SAJeSolarMetricSensor(SensorEntity):
+    """Diagnostic sensor with the latency of the poll cycles, or of the requests to one endpoint.
+
+    The state is the latest latency, the attributes hold the histogram and counters.
+    """
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+    _attr_native_unit_of_measurement = "s"
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_should_poll = False
+    _attr_icon = "mdi:timer-outline"
+
+    def __init__(self, metrics, endpoint, metrics_key):
+        """Initialize the sensor, an endpoint of None reports the poll cycles, metrics_key tells the platforms apart."""
+        self._metrics = metrics
+        self._endpoint = endpoint
+        name = endpoint or "poll"
+        self._attr_name = f"{SENSOR_PREFIX}{name} latency"
+        self._attr_unique_id = f"{SENSOR_PREFIX}_{slugify(metrics_key)}_{name}_latency"
+
+    async def async_added_to_hass(self):
+        self.async_on_remove(self._metrics.add_listener(self.async_write_ha_state))
+
+    @property
+    def native_value(self):
+        if self._endpoint is None:
+            return self._metrics.cycles.last
+        endpoint = self._metrics.endpoints.get(self._endpoint)
+        return endpoint.latency.last if endpoint is not None else None
+
+    @property
+    def extra_state_attributes(self):
+        metrics = self._metrics.as_dict()
+        if self._endpoint is None:
+            del metrics["endpoints"]
+            return metrics
+        # an endpoint that was not called yet
+        return metrics["endpoints"].get(self._endpoint)
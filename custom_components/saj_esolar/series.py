@@ -0,0 +1,51 @@
+"""
+Compact time series of the intraday portal charts.
+A chart is a list of "HH:MM" xAxis labels with one list of samples per series in
+dataCountList; a series keeps the minutes of the day and the values in two arrays
+instead of a list of python objects per sample.
+"""
+
+from array import array
+import datetime
+
+from homeassistant.util import dt
+
+
+class ChartSeries(object):
+    """One series of a day chart, the samples without a value are left out."""
+
+    __slots__ = ("day", "minutes", "values")
+
+    def __init__(self, day, minutes=None, values=None):
+        self.day     = day
+        self.minutes = minutes if minutes is not None else array("H")
+        self.values  = values if values is not None else array("d")
+
+    @classmethod
+    def from_chart(cls, chart, index, day):
+        """Parse series index of a portal day chart of day."""
+        series = cls(day)
+        for label, value in zip(chart["xAxis"], chart["dataCountList"][index]):
+            if value is None or value == "":
+                continue
+            series.minutes.append(int(label[:2]) * 60 + int(label[3:5]))
+            series.values.append(float(value))
+        return series
+
+    def __len__(self):
+        return len(self.values)
+
+    def timestamp(self, idx):
+        """Return the local time of sample idx."""
+        return datetime.datetime.combine(self.day, datetime.time(*divmod(self.minutes[idx], 60)), tzinfo=dt.DEFAULT_TIME_ZONE)
+
+    def since(self, previous):
+        """Return the (timestamp, value) of the samples that are new or changed since the previous series."""
+        if previous is None or previous.day != self.day:
+            return [(self.timestamp(idx), value) for idx, value in enumerate(self.values)]
+        known = dict(zip(previous.minutes, previous.values))
+        return [
+            (self.timestamp(idx), value)
+            for idx, value in enumerate(self.values)
+            if known.get(self.minutes[idx]) != value
+        ]
@@ -0,0 +1,402 @@
+"""
+Authenticated session handling for the eSolar portal.
+The portal is cookie based, so instead of a login/logout round trip on every poll
+we keep the cookie jar alive and only log in again once the portal tells us the
+session has expired.
+"""
+
+import asyncio
+from email.utils import parsedate_to_datetime
+import logging
+import random
+import time
+
+import aiohttp
+import async_timeout
+
+from homeassistant.helpers.aiohttp_client import async_create_clientsession
+
+from .const import DOMAIN
+from .decode import json_loads
+
+_LOGGER = logging.getLogger(__name__)
+
+HEADERS_LOGIN = {
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Accept-Language': 'nl-NL,nl;q=0.9,en-US;q=0.8,en;q=0.7',
+    'Cache-Control': 'max-age=0',
+    'Connection': 'keep-alive',
+    'Content-Type': 'application/x-www-form-urlencoded',
+    'Cookie': 'org.springframework.web.servlet.i18n.CookieLocaleResolver.LOCALE=en; op_esolar_lang=en',
+    'DNT': '1',
+    'sec-ch-ua': '" Not;A Brand";v="99", "Google Chrome";v="91", "Chromium";v="91"',
+    'sec-ch-ua-mobile': '?0',
+    'Sec-Fetch-Dest': 'document',
+    'Sec-Fetch-Mode': 'navigate',
+    'Sec-Fetch-Site': 'same-origin',
+    'Sec-Fetch-User': '?1',
+    'Upgrade-Insecure-Requests': '1',
+    'User-Agent'
+    : 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36'
+}
+
+HEADERS_JSON = {
+    'Connection': 'keep-alive',
+    'sec-ch-ua': '" Not;A Brand";v="99", "Google Chrome";v="91", "Chromium";v="91"',
+    'Accept': 'application/json, text/javascript, */*; q=0.01',
+    'DNT': '1',
+    'X-Requested-With': 'XMLHttpRequest',
+    'sec-ch-ua-mobile': '?0',
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.106 Safari/537.36',
+    'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+    'Sec-Fetch-Site': 'same-origin',
+    'Sec-Fetch-Mode': 'cors',
+    'Sec-Fetch-Dest': 'empty',
+    'Accept-Language': 'nl-NL,nl;q=0.9,en-US;q=0.8,en;q=0.7'
+}
+
+# Status codes the portal answers with when the session cookie is no longer valid
+EXPIRED_STATUS = (401, 302, 303)
+
+# Portal requests all accounts of one provider may have in flight at the same time
+MAX_PROVIDER_CONNECTIONS = 8
+
+# Seconds one request attempt may take before it is abandoned (and retried)
+REQUEST_TIMEOUT = 20.0
+
+# Status codes of a busy or briefly unavailable portal, worth another try
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+# Retries of a failed request, with exponential backoff and full jitter in seconds
+MAX_RETRIES = 2
+RETRY_BACKOFF = 1.0
+RETRY_BACKOFF_MAX = 30.0
+
+# Failed requests in a row that open the circuit of a provider, and seconds until it probes again
+BREAKER_THRESHOLD = 5
+BREAKER_RESET = 60.0
+
+
+class EsolarError(Exception):
+    """A portal call returned something we can't use."""
+
+
+class EsolarAuthError(EsolarError):
+    """Logging in to the portal failed."""
+
+
+class EsolarSessionExpired(EsolarError):
+    """The portal answered with a login page instead of data."""
+
+
+class EsolarRetryableError(EsolarError):
+    """The portal is busy or briefly unavailable, retry_after is the delay it asked for."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class EsolarCircuitOpen(EsolarError):
+    """Requests to the portal are suspended after repeated failures."""
+
+
+def retry_after(response):
+    """Return the seconds of the Retry-After header of a response, or None."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt, delay=None):
+    """Return the seconds to wait before retry attempt, at least the delay the portal asked for."""
+    return max(delay or 0.0, random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** attempt)))
+
+
+class CircuitBreaker(object):
+    """Stops the requests to a portal that keeps failing.
+
+    The circuit opens after threshold failures in a row. Once reset seconds have
+    passed a single request is let through (half open) while the other requests
+    wait for it: its success closes the circuit again, its failure opens it for
+    another reset seconds.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset=BREAKER_RESET):
+        self._threshold = threshold
+        self._reset     = reset
+        self._failures  = 0
+        self._opened    = None
+        self._probe     = None
+
+    @property
+    def is_open(self):
+        return self._opened is not None
+
+    @property
+    def half_open(self):
+        return self._probe is not None
+
+    def retry_in(self):
+        """Return the seconds until the open circuit lets a probe through."""
+        return max(0.0, self._opened + self._reset - time.monotonic()) if self._opened is not None else 0.0
+
+    async def async_allow(self):
+        """Return True when a request may be done now, waiting for the outcome of a running probe."""
+        while self._probe is not None:
+            await self._probe.wait()
+        if self._opened is None:
+            return True
+        if self.retry_in() > 0:
+            return False
+        self._probe = asyncio.Event()
+        return True
+
+    def _end_probe(self):
+        if self._probe is not None:
+            self._probe.set()
+            self._probe = None
+
+    def record_success(self):
+        if self._opened is not None:
+            _LOGGER.info("eSolar portal is reachable again")
+        self._failures = 0
+        self._opened   = None
+        self._end_probe()
+
+    def record_failure(self):
+        self._failures += 1
+        if self._probe is not None or (self._opened is None and self._failures >= self._threshold):
+            if self._opened is None:
+                _LOGGER.warning("eSolar portal failed %d times in a row, pausing requests for %d seconds", self._failures, self._reset)
+            self._opened = time.monotonic()
+        self._end_probe()
+
+    def release(self):
+        """Let another request probe, the probe ended without telling anything about the portal."""
+        self._end_probe()
+
+
+class EsolarSession(object):
+    """Keeps one logged in eSolar session (cookie jar) alive across polls."""
+
+    def __init__(self, session: aiohttp.ClientSession, provider, username, password, semaphore=None, breaker=None):
+        self._session  = session
+        self._provider = provider
+        self.username  = username
+        self.password  = password
+        self._semaphore  = semaphore or asyncio.Semaphore(MAX_PROVIDER_CONNECTIONS)
+        self._breaker    = breaker or CircuitBreaker()
+        self._logged_in  = False
+        self._login_lock = asyncio.Lock()
+
+    @property
+    def session(self):
+        return self._session
+
+    @property
+    def logged_in(self):
+        return self._logged_in
+
+    def invalidate(self):
+        """Forget the current login, the next request will log in again."""
+        self._logged_in = False
+
+    async def async_login(self, timeout=REQUEST_TIMEOUT, metrics=None):
+        """Login to eSolar API, unless a concurrent caller already did."""
+        async with self._login_lock:
+            if self._logged_in:
+                return
+            self._session.cookie_jar.clear()
+            url = self._provider.getLoginUrl()
+            payload = {
+                'lang': 'en',
+                'username': self.username,
+                'password': self.password,
+                'rememberMe': 'true'
+            }
+            headers = dict(HEADERS_LOGIN)
+            headers['Host'] = self._provider.host
+            headers['Origin'] = self._provider.host
+            headers['Referer'] = self._provider.getLoginUrl()
+            endpoint = metrics.endpoint(url) if metrics is not None else None
+            async with self._semaphore:
+                started = time.monotonic()
+                try:
+                    async with async_timeout.timeout(timeout), self._session.post(url, headers=headers, data=payload) as response:
+                        body = await response.read()
+                except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+                    if endpoint is not None:
+                        endpoint.record_error(err, time.monotonic() - started)
+                    raise
+            if endpoint is not None:
+                endpoint.record_response(response.status, time.monotonic() - started, len(body))
+            if response.status in RETRY_STATUS:
+                raise EsolarRetryableError(f"{response.url} returned {response.status}", retry_after(response))
+            if response.status != 200:
+                raise EsolarAuthError(f"{response.url} returned {response.status}")
+            # the portal answers a rejected login with the login form, also with a 200
+            redirected_to_login = bool(response.history) and response.url.path.endswith("/login")
+            cookie_set = any(answer.cookies for answer in (*response.history, response))
+            if redirected_to_login or not cookie_set:
+                raise EsolarAuthError(f"{self._provider.getBaseDomain()} rejected the login of {self.username}, check the username and password")
+            self._logged_in = True
+            _LOGGER.debug("Logged in to %s", self._provider.getBaseDomain())
+
+    async def async_logout(self, metrics=None):
+        """Logout the session and clear the cookies."""
+        if not self._logged_in:
+            return
+        self._logged_in = False
+        url = f"{self._provider.getBaseUrl()}/logout"
+        started = time.monotonic()
+        try:
+            async with async_timeout.timeout(REQUEST_TIMEOUT), self._session.post(url, headers=self._headers()) as response:
+                if metrics is not None:
+                    metrics.endpoint(url).record_response(response.status, time.monotonic() - started)
+                if response.status != 200:
+                    _LOGGER.error(f"{response.url} returned {response.status}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            if metrics is not None:
+                metrics.endpoint(url).record_error(err, time.monotonic() - started)
+            _LOGGER.debug("Logout failed: %s", err)
+        self._session.cookie_jar.clear()
+
+    async def async_request(self, method, url, data=None, timeout=REQUEST_TIMEOUT, metrics=None):
+        """Do a JSON request, retrying a busy or unreachable portal with backoff.
+
+        The login an attempt needs and its request each get timeout seconds, once
+        they have a connection slot. An attempt finding the session expired logs in
+        and requests again, so it may take up to about 4 times timeout. The requests
+        and retries are recorded in the PollMetrics metrics.
+        Raises EsolarCircuitOpen without a request while the portal of the provider
+        is considered down.
+        """
+        for attempt in range(MAX_RETRIES + 1):
+            if not await self._breaker.async_allow():
+                raise EsolarCircuitOpen(f"eSolar portal unavailable, next try in {self._breaker.retry_in():.0f} seconds")
+            probe = self._breaker.half_open
+            try:
+                result = await self._async_request(method, url, data, timeout, metrics)
+            except (EsolarRetryableError, aiohttp.ClientError, asyncio.TimeoutError) as err:
+                self._breaker.record_failure()
+                delay = getattr(err, "retry_after", None)
+                if attempt == MAX_RETRIES or self._breaker.is_open or (delay or 0) > RETRY_BACKOFF_MAX:
+                    raise
+                delay = backoff(attempt, delay)
+                if metrics is not None:
+                    metrics.endpoint(url).record_retry()
+                _LOGGER.debug("%s failed (%s), retrying in %.1f seconds", url, err, delay)
+                await asyncio.sleep(delay)
+            except EsolarError:
+                # the portal answered, it is up even if this answer is of no use
+                self._breaker.record_success()
+                raise
+            except BaseException:
+                if probe:
+                    self._breaker.release()
+                raise
+            else:
+                self._breaker.record_success()
+                return result
+
+    async def _async_request(self, method, url, data, timeout, metrics):
+        """Do a JSON request, logging in again once if the session expired."""
+        if not self._logged_in:
+            await self.async_login(timeout, metrics)
+        try:
+            return await self._request(method, url, data, timeout, metrics)
+        except EsolarSessionExpired:
+            _LOGGER.debug("eSolar session expired, logging in again")
+            self.invalidate()
+            await self.async_login(timeout, metrics)
+            return await self._request(method, url, data, timeout, metrics)
+
+    def _headers(self):
+        headers = dict(HEADERS_JSON)
+        headers['Origin'] = self._provider.host
+        headers['Referer'] = f"{self._provider.getBaseUrl()}/monitor/home/index"
+        return headers
+
+    def _is_login_page(self, response):
+        location = response.headers.get("Location", "")
+        return "login" in location or response.url.path.endswith("/login")
+
+    async def _request(self, method, url, data, timeout, metrics):
+        endpoint = metrics.endpoint(url) if metrics is not None else None
+        # the timeout starts once the request got a connection slot, and covers reading the body
+        async with self._semaphore:
+            started = time.monotonic()
+            try:
+                async with async_timeout.timeout(timeout), self._session.request(
+                    method, url, headers=self._headers(), data=data, allow_redirects=False
+                ) as response:
+                    body = await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+                if endpoint is not None:
+                    endpoint.record_error(err, time.monotonic() - started)
+                raise
+        latency = time.monotonic() - started
+
+        if response.status != 200 or "json" not in response.content_type:
+            if endpoint is not None:
+                endpoint.record_response(response.status, latency, len(body))
+            if response.status in EXPIRED_STATUS or self._is_login_page(response):
+                raise EsolarSessionExpired(f"{response.url} returned {response.status}")
+            if response.status in RETRY_STATUS:
+                raise EsolarRetryableError(f"{response.url} returned {response.status}", retry_after(response))
+            if response.status != 200:
+                raise EsolarError(f"{response.url} returned {response.status}")
+            # the portal serves the html login page when the cookie is no longer valid
+            raise EsolarSessionExpired(f"{response.url} returned {response.content_type}")
+
+        decoding = time.monotonic()
+        result = json_loads(body)
+        if endpoint is not None:
+            endpoint.record_response(response.status, latency, len(body), time.monotonic() - decoding)
+        return result
+
+
+class EsolarPool(object):
+    """Shares the portal sessions, one request limit and one circuit breaker between the accounts of a provider.
+
+    The client sessions of Home Assistant already share a connector (keep-alive
+    sockets, DNS and TLS session caches) per verify_ssl setting, so every
+    account only gets its own cookie jar. Platform entries of the same account
+    share one logged in session.
+    """
+
+    def __init__(self, hass, provider, verify_ssl):
+        self._hass       = hass
+        self._provider   = provider
+        self._verify_ssl = verify_ssl
+        self._sessions   = {}
+        self.semaphore   = asyncio.Semaphore(MAX_PROVIDER_CONNECTIONS)
+        self.breaker     = CircuitBreaker()
+
+    def get_session(self, username, password):
+        """Return the session of an account, creating it on first use."""
+        esolar = self._sessions.get(username)
+        if esolar is None or esolar.password != password:
+            session = async_create_clientsession(self._hass, verify_ssl=self._verify_ssl) #some providers have broken SSL chains
+            esolar = EsolarSession(session, self._provider, username, password, self.semaphore, self.breaker)
+            self._sessions[username] = esolar
+        return esolar
+
+
+def async_get_pool(hass, provider, verify_ssl):
+    """Return the pool of a provider, shared by every platform entry using it."""
+    pools = hass.data.setdefault(DOMAIN, {}).setdefault("pools", {})
+    key = (provider.getBaseUrl(), verify_ssl)
+    if key not in pools:
+        pools[key] = EsolarPool(hass, provider, verify_ssl)
+    return pools[key]
@@ -0,0 +1,79 @@
+"""
+Last known good results of the portal endpoints of a plant.
+A failing endpoint keeps its previous result, so one failed call doesn't throw away
+the fresh results of the other endpoints of a poll. The sensors of an endpoint only
+become unavailable once it kept failing for longer than the staleness limit.
+"""
+
+import logging
+
+from .telemetry import SNAPSHOT_PARTS
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class EndpointSource(object):
+    """Where the data behind a sensor comes from: the endpoint, when it was fetched and if it is stale."""
+
+    __slots__ = ("endpoint", "fetched", "stale")
+
+    def __init__(self, endpoint, fetched, stale):
+        self.endpoint = endpoint
+        self.fetched  = fetched
+        self.stale    = stale
+
+
+class EndpointSnapshot(object):
+    """The last good fetch plan results of one plant.
+
+    Keeps, by fetch step, when it last succeeded and when it last failed. Derive
+    steps follow the fetch step they come from.
+    """
+
+    def __init__(self, stale_after):
+        self._stale_after = stale_after
+        self.results   = {}
+        self.sources   = {}
+        self.stale     = frozenset()
+        self.succeeded = {}
+        self.failed    = {}
+
+    def update(self, planner, results, seed, errors, now):
+        """Merge the results of a poll, seeded steps were not fetched by it and keep their fetch time."""
+        good = dict(self.results)
+        for step in planner.steps:
+            if step.name in results:
+                good[step.name] = results[step.name]
+                if step.fetch is not None and step.name not in seed:
+                    self.succeeded[step.name] = now
+            elif step.name in errors and step.fetch is not None:
+                self.failed[step.name] = now
+        self.results = good
+        names = {step.name for step in planner.steps}
+        self.sources = {
+            name: planner.origin(step) for name, (step, path, build) in SNAPSHOT_PARTS.items() if step in names
+        }
+
+    def fail(self, now):
+        """Record a poll that failed as a whole, every fetch step failed."""
+        for name in set(self.succeeded) | set(self.failed):
+            self.failed[name] = now
+
+    def refresh(self, now):
+        """Recompute the stale fetch steps, return True when they changed."""
+        stale = frozenset(
+            name for name, failed in self.failed.items()
+            if failed >= self.succeeded.get(name, failed) and now - self.succeeded.get(name, float("-inf")) > self._stale_after
+        )
+        changed = stale != self.stale
+        if changed:
+            _LOGGER.debug("Stale endpoints: %s", sorted(stale))
+        self.stale = stale
+        return changed
+
+    def source(self, key):
+        """Return the EndpointSource of a PlantSnapshot attribute, or None when it is unknown."""
+        endpoint = self.sources.get(key)
+        if endpoint is None:
+            return None
+        return EndpointSource(endpoint, self.succeeded.get(endpoint), endpoint in self.stale)
@@ -0,0 +1,293 @@
+"""
+Data sources of the plant telemetry.
+The coordinator polls one DataSource: the eSolar portal (SAJeSolarMeterData), the
+local Modbus-TCP interface of the inverter, which answers in milliseconds and doesn't
+wait for the cloud upload of the device, or a hybrid of both.
+"""
+
+import abc
+import asyncio
+import dataclasses
+import logging
+import time
+
+from homeassistant.helpers.update_coordinator import UpdateFailed
+
+from .flight import SingleFlight
+from .metrics import PollMetrics
+from .modbus import ModbusError, Register, register_blocks
+from .snapshot import EndpointSource
+from .telemetry import SNAPSHOT_PARTS, Plant, PlantSnapshot
+
+_LOGGER = logging.getLogger(__name__)
+
+# Endpoint the values of the local source are reported from
+LOCAL_ENDPOINT = "modbus"
+
+SOURCE_CLOUD = "cloud"
+SOURCE_LOCAL = "local"
+
+# Sensor key -> register of the realtime data of an SAJ H1, powers in W and the battery
+# level in %. Signed powers are positive when discharging the battery and exporting.
+H1_REGISTERS = {
+    "nowPower":             Register(0x4098, "int16"),
+    "pvPower":              Register(0x40A1, "int16"),
+    "solarPower":           Register(0x40A1, "int16"),
+    "batteryPower":         Register(0x40A5, "int16"),
+    "batEnergyPercent":     Register(0x406B, "uint16", 0.01),
+    "batCurr":              Register(0x406D, "int16", 0.01),
+    "gridPower":            Register(0x40A9, "int16"),
+    "outPower":             Register(0x40AD, "int16"),
+    "totalLoadPower":       Register(0x40A3, "int16"),
+}
+
+# Signed power field of a part -> direction field the portal reports next to its magnitude
+POWER_DIRECTIONS = {
+    "batteryPower": "batteryDirection",
+    "gridPower":    "gridDirection",
+    "pvPower":      "pvDirection",
+    "outPower":     "outPutDirection",
+}
+
+
+class DataSource(abc.ABC):
+    """A source of the PlantSnapshot of the plants, polled by the coordinator.
+
+    async_update returns the snapshots by plantuid and raises UpdateFailed when the
+    source can't be read. source tells where the value at an extractor path of a
+    snapshot comes from.
+
+    Sources implement _async_update_data, async_update runs it single flight: callers
+    arriving while it runs await that update, and an update within
+    min_update_interval seconds of the previous one serves that one.
+    """
+
+    metrics = None
+    min_update_interval = 0.0
+    _flight = None
+
+    async def async_update(self):
+        if self._flight is None:
+            self._flight = SingleFlight(self.min_update_interval)
+        return await self._flight.async_call(self._async_update_data)
+
+    @abc.abstractmethod
+    async def _async_update_data(self):
+        """Return the snapshots of the plants by plantuid, raises UpdateFailed when the source can't be read."""
+
+    def source(self, plantuid, path):
+        """Return the EndpointSource of the value at a path of the PlantSnapshot of a plant, or None when it is unknown."""
+        return None
+
+    def endpoints(self):
+        """Return the names of every endpoint the source may record metrics of."""
+        return set()
+
+    async def async_close(self, *_):
+        """Release the connection of the source."""
+
+
+class LocalModbusSource(DataSource):
+    """Reads the live values of one inverter from its Modbus-TCP interface.
+
+    registers maps sensor keys to inverter registers and paths maps them to the
+    (snapshot attribute, field) they fill. The last read values are served until
+    the inverter didn't answer for stale_after. metrics are shared with the portal
+    source of a hybrid.
+    """
+
+    def __init__(self, client, registers, paths, plantuid, plantname, stale_after, metrics=None):
+        self._client      = client
+        self._registers   = {key: register for key, register in registers.items() if key in paths}
+        self._paths       = {key: path for key, path in paths.items() if key in self._registers}
+        self._blocks      = register_blocks(self._registers.values())
+        self._stale_after = stale_after.total_seconds()
+        self.plantuid     = plantuid
+        self.plantname    = plantname
+        self.metrics      = metrics or PollMetrics()
+        self._fetched     = None
+        self._data        = None
+
+    async def _async_update_data(self):
+        """Read the registers and return the snapshot of the plant, raises UpdateFailed when that is not possible."""
+        started = time.monotonic()
+        try:
+            values = await self.async_read()
+        except (OSError, asyncio.TimeoutError, ModbusError) as err:
+            self.metrics.record_cycle(time.monotonic() - started, False)
+            if self._data is None or time.time() - self._fetched > self._stale_after:
+                raise UpdateFailed(f"Cannot read {self._client.host} using Modbus-TCP: {err}") from err
+            _LOGGER.warning("Cannot read %s using Modbus-TCP, serving the last known data: %s", self._client.host, err)
+            return self._data
+        self.metrics.record_cycle(time.monotonic() - started, True)
+        self._fetched = time.time()
+
+        snapshot = self.build(values)
+        if self._data is None or self._data[self.plantuid] != snapshot:
+            self._data = {self.plantuid: snapshot}
+        return self._data
+
+    async def async_read(self):
+        """Return the values of the registers by sensor key."""
+        words = {}
+        metrics = self.metrics.endpoint(LOCAL_ENDPOINT)
+        for address, count in self._blocks:
+            started = time.monotonic()
+            try:
+                block = await self._client.async_read_registers(address, count)
+            except Exception as err:
+                metrics.record_error(err, time.monotonic() - started)
+                raise
+            metrics.record_response("ok", time.monotonic() - started, 2 * count)
+            words.update(zip(range(address, address + count), block))
+        return {
+            key: register.decode([words[address] for address in range(register.address, register.address + register.count)])
+            for key, register in self._registers.items()
+        }
+
+    def build(self, values):
+        """Return the PlantSnapshot of the values by sensor key."""
+        parts = {}
+        for key, value in values.items():
+            name, field = self._paths[key]
+            parts.setdefault(name, {})[field] = value
+        snapshot = {"plant": Plant(plantuid=self.plantuid, plantname=self.plantname)}
+        for name, fields in parts.items():
+            for power, direction in POWER_DIRECTIONS.items():
+                if power in fields and direction not in fields:
+                    fields[direction] = (fields[power] > 0) - (fields[power] < 0)
+                    fields[power] = abs(fields[power])
+            snapshot[name] = SNAPSHOT_PARTS[name][2].from_json(fields)
+        return PlantSnapshot(**snapshot)
+
+    @property
+    def paths(self):
+        return self._paths
+
+    def endpoints(self):
+        return {LOCAL_ENDPOINT}
+
+    @property
+    def stale(self):
+        return self._fetched is None or time.time() - self._fetched > self._stale_after
+
+    def source(self, plantuid, path):
+        if self._fetched is None:
+            return None
+        return EndpointSource(LOCAL_ENDPOINT, self._fetched, self.stale)
+
+    async def async_close(self, *_):
+        await self._client.async_close()
+
+
+def local_paths(keys, resolve):
+    """Return the (snapshot attribute, field) of the sensor keys a local register can fill.
+
+    resolve returns the extractor of a sensor key, values of the other keys only exist
+    in the portal.
+    """
+    paths = {}
+    for key in keys:
+        extractor = resolve(key)
+        if extractor is None or len(extractor.path) != 2 or extractor.path[0] not in SNAPSHOT_PARTS:
+            continue
+        build = SNAPSHOT_PARTS[extractor.path[0]][2]
+        if isinstance(build, type):
+            paths[key] = extractor.path
+    return paths
+
+
+class HybridSource(DataSource):
+    """Merges the fast local values into the snapshot of the plant of the portal.
+
+    priority maps sensor keys to their preferred source, SOURCE_LOCAL or SOURCE_CLOUD,
+    the other one is the fallback when the preferred one has no fresh value. The
+    local source is read every poll, the portal once per cloud_interval in the
+    background, so a slow portal doesn't hold up the live values.
+    """
+
+    def __init__(self, cloud, local, priority, cloud_interval):
+        self._cloud    = cloud
+        self._local    = local
+        self._cloud_interval = cloud_interval.total_seconds()
+        self.metrics   = local.metrics
+        # (snapshot attribute, field) -> preferred source of the value
+        self._priority = {local.paths[key]: source for key, source in priority.items() if key in local.paths}
+        # (snapshot attribute, field) of the values the last merge took from the local source
+        self._from_local   = set()
+        self._cloud_data   = None
+        self._cloud_polled = None
+        self._cloud_task   = None
+        self._local_data   = None
+        self._data         = None
+
+    async def _async_update_data(self):
+        """Read the local source and merge it into the last portal data, raises UpdateFailed when neither answers."""
+        if self._cloud_task is None and (
+            self._cloud_polled is None or time.monotonic() - self._cloud_polled >= self._cloud_interval
+        ):
+            self._cloud_polled = time.monotonic()
+            self._cloud_task = asyncio.ensure_future(self._async_update_cloud())
+        if self._cloud_data is None:
+            # the plant of the first poll names the entities
+            await asyncio.shield(self._cloud_task)
+            if self._cloud_data is None:
+                raise UpdateFailed("Cannot poll the eSolar portal for the plant of the local source")
+
+        try:
+            self._local_data = await self._local.async_update()
+        except UpdateFailed as err:
+            _LOGGER.warning("%s, serving the values of the portal", err)
+            self._local_data = None
+
+        data = {plantuid: self._merge(snapshot) for plantuid, snapshot in self._cloud_data.items()}
+        if data != self._data:
+            self._data = data
+        return self._data
+
+    async def _async_update_cloud(self):
+        try:
+            self._cloud_data = await self._cloud.async_update()
+        except UpdateFailed as err:
+            _LOGGER.warning("%s, keeping the portal data of the previous poll", err)
+        finally:
+            self._cloud_task = None
+
+    def _merge(self, snapshot):
+        """Return the portal snapshot with the local values it prefers, or has no value for."""
+        self._from_local = set()
+        if self._local_data is None or self._local.stale:
+            return dataclasses.replace(snapshot, stale=snapshot.stale | {LOCAL_ENDPOINT})
+        local = self._local_data[self._local.plantuid]
+
+        values = {}
+        for (name, field), preferred in self._priority.items():
+            local_value = getattr(getattr(local, name), field, None)
+            cloud_value = getattr(getattr(snapshot, name), field, None)
+            if local_value is None or (preferred == SOURCE_CLOUD and cloud_value is not None):
+                continue
+            fields = values.setdefault(name, {})
+            fields[field] = local_value
+            if field in POWER_DIRECTIONS:
+                # the direction of a signed local power goes with its magnitude
+                fields[POWER_DIRECTIONS[field]] = getattr(getattr(local, name), POWER_DIRECTIONS[field])
+            self._from_local.add((name, field))
+        parts = {
+            name: dataclasses.replace(getattr(snapshot, name) or SNAPSHOT_PARTS[name][2](), **fields)
+            for name, fields in values.items()
+        }
+        return dataclasses.replace(snapshot, **parts)
+
+    def endpoints(self):
+        return self._cloud.endpoints() | self._local.endpoints()
+
+    def source(self, plantuid, path):
+        if (path[0], path[-1]) in self._from_local:
+            return self._local.source(plantuid, path)
+        return self._cloud.source(plantuid, path)
+
+    async def async_close(self, *_):
+        if self._cloud_task is not None:
+            self._cloud_task.cancel()
+        await self._local.async_close()
+        await self._cloud.async_close()
@@ -0,0 +1,235 @@
+"""
+Typed telemetry snapshot of a plant.
+Every poll builds one PlantSnapshot from the fetch plan results. Each part of it comes
+from one endpoint, so responses sharing keys like status or list can't overwrite each
+other, and the numbers of the portal are converted from strings once per poll instead
+of in every entity.
+"""
+
+import dataclasses
+
+
+def to_float(value):
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_int(value):
+    if value is None or value == "":
+        return None
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+# Field type -> conversion of the portal value, other types are kept as they are
+CONVERTERS = {float: to_float, int: to_int}
+
+
+class Part(object):
+    """Base of the typed parts of a snapshot, built from one object of a portal response."""
+
+    __slots__ = ()
+
+    @classmethod
+    def from_json(cls, data):
+        values = {}
+        for field in dataclasses.fields(cls):
+            value = data.get(field.name)
+            convert = CONVERTERS.get(field.type)
+            values[field.name] = convert(value) if convert is not None else value
+        return cls(**values)
+
+
+@dataclasses.dataclass(slots=True)
+class Plant(Part):
+    """Entry of the plant in getUserPlantList."""
+
+    plantuid: str = None
+    plantname: str = None
+    currency: str = None
+    address: str = None
+    isOnline: object = None
+    systempower: object = None
+
+
+@dataclasses.dataclass(slots=True)
+class Device(Part):
+    """A device of the plant, an entry of findDevicePageList or a serial of snList the list lacks."""
+
+    devicesn: str = None
+    type: int = None
+    deviceModel: str = None
+    isOnline: int = None
+
+
+@dataclasses.dataclass(slots=True)
+class PlantDetail(Part):
+    """plantDetail of getPlantDetailInfo."""
+
+    nowPower: float = None
+    runningState: int = None
+    devOnlineNum: int = None
+    todayElectricity: float = None
+    monthElectricity: float = None
+    yearElectricity: float = None
+    totalElectricity: float = None
+    todayGridIncome: float = None
+    income: float = None
+    selfUseRate: str = None
+    totalBuyElec: float = None
+    totalConsumpElec: float = None
+    totalSellElec: float = None
+    lastUploadTime: str = None
+    totalPlantTreeNum: str = None
+    totalReduceCo2: str = None
+    snList: list = None
+
+
+@dataclasses.dataclass(slots=True)
+class StoreDevicePower(Part):
+    """storeDevicePower of getStoreOrAcDevicePowerInfo, the live values of an h1 battery inverter."""
+
+    batCapcity: float = None
+    isStorageAlarm: int = None
+    batCurr: float = None
+    batEnergyPercent: float = None
+    batteryDirection: int = None
+    batteryPower: float = None
+    gridDirection: int = None
+    gridPower: float = None
+    isOnline: int = None
+    outPower: float = None
+    outPutDirection: int = None
+    pvDirection: int = None
+    pvPower: float = None
+    solarPower: float = None
+    totalLoadPower: float = None
+
+
+@dataclasses.dataclass(slots=True)
+class MeterViewBean(Part):
+    """viewBean of a chart, the energy totals of the day."""
+
+    pvElec: float = None
+    useElec: float = None
+    buyElec: float = None
+    sellElec: float = None
+    buyRate: str = None
+    sellRate: str = None
+    selfConsumedRate1: str = None
+    selfConsumedRate2: str = None
+    selfConsumedEnergy1: float = None
+    selfConsumedEnergy2: float = None
+    chargeElec: float = None
+    dischargeElec: float = None
+    reduceCo2: float = None
+    plantTreeNum: str = None
+
+
+@dataclasses.dataclass(slots=True)
+class MeterDetail(Part):
+    """plantDetail of getPlantMeterDetailInfo, the lifetime totals of the Sec module."""
+
+    totalPvEnergy: float = None
+    totalLoadEnergy: float = None
+    totalBuyEnergy: float = None
+    totalSellEnergy: float = None
+
+
+class DeviceParts(object):
+    """Builds the part of every device of a plant by serial, from a list of device objects.
+
+    key names the object of a device item the part is built from, None the item itself.
+    """
+
+    __slots__ = ("part", "key")
+
+    def __init__(self, part, key=None):
+        self.part = part
+        self.key  = key
+
+    def __call__(self, items):
+        parts = {}
+        for item in items:
+            data = item.get(self.key) if self.key else item
+            if item.get("devicesn") and isinstance(data, dict):
+                parts[item["devicesn"]] = self.part.from_json(data)
+        return parts
+
+    def paths(self):
+        prefix = (self.key,) if self.key else ()
+        return [("devicesn",)] + [prefix + (field.name,) for field in dataclasses.fields(self.part)]
+
+
+@dataclasses.dataclass(slots=True)
+class PlantSnapshot(object):
+    """The telemetry of a plant after a poll, the parts of endpoints that were not polled are None.
+
+    devices and device_powers hold the parts of every device by serial.
+
+    stale are the fetch steps that failed for longer than the staleness limit.
+    """
+
+    plant: Plant = None
+    detail: PlantDetail = None
+    status: str = None
+    peak_power: float = None
+    view_bean: MeterViewBean = None
+    device_power: StoreDevicePower = None
+    meter_view_bean: MeterViewBean = None
+    meter_detail: MeterDetail = None
+    meter_curves: list = None
+    devices: dict = None
+    device_powers: dict = None
+    stale: frozenset = frozenset()
+
+    @classmethod
+    def from_results(cls, results, stale=frozenset()):
+        """Build the snapshot from the fetch plan results of a plant."""
+        values = {"stale": stale}
+        for name, (step, path, build) in SNAPSHOT_PARTS.items():
+            value = results.get(step)
+            for key in path:
+                value = value.get(key) if isinstance(value, dict) else None
+            if value is not None and build is not None:
+                value = build.from_json(value) if isinstance(build, type) else build(value)
+            values[name] = value
+        return cls(**values)
+
+
+# Snapshot attribute -> fetch step, path of the part in the step result and how it is built.
+# status is the one of getPlantDetailInfo, the other responses have their own status too.
+SNAPSHOT_PARTS = {
+    "plant":           ("plant", (), Plant),
+    "detail":          ("getPlantDetailInfo", ("plantDetail",), PlantDetail),
+    "status":          ("getPlantDetailInfo", ("status",), None),
+    "peak_power":      ("getPlantDetailChart2", ("peakPower",), to_float),
+    "view_bean":       ("getPlantDetailChart2", ("viewBean",), MeterViewBean),
+    "device_power":    ("getStoreOrAcDevicePowerInfo", ("storeDevicePower",), StoreDevicePower),
+    "meter_view_bean": ("getPlantMeterChartData", ("viewBean",), MeterViewBean),
+    "meter_detail":    ("getPlantMeterDetailInfo", ("plantDetail",), MeterDetail),
+    "meter_curves":    ("meterCurves", (), None),
+    "devices":         ("devices", (), DeviceParts(Device)),
+    "device_powers":   ("devicePowerInfo", ("devices",), DeviceParts(StoreDevicePower, "storeDevicePower")),
+}
+
+
+def part_paths(step):
+    """Return the paths in the result of a fetch step the snapshot is built from."""
+    paths = []
+    for name, (part_step, path, build) in SNAPSHOT_PARTS.items():
+        if part_step != step:
+            continue
+        if isinstance(build, type) and issubclass(build, Part):
+            paths += [path + (field.name,) for field in dataclasses.fields(build)]
+        elif isinstance(build, DeviceParts):
+            paths += [path + device_path for device_path in build.paths()]
+        elif path:
+            paths.append(path)
+    return paths
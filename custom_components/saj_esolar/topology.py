@@ -0,0 +1,83 @@
+"""
+Cache of the static plant/device topology (plant list, device serial, meter modules).
+These rarely change, so steady-state polls skip the discovery calls and only hit
+the live telemetry endpoints.
+"""
+
+import logging
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+
+# Fetch plan steps that make up the topology of a plant, next to the account wide plant list.
+# The device list is not part of it, it holds the live online state of every device.
+TOPOLOGY_STEPS = (
+    "plantuid",
+    "deviceSnArr",
+    "getPlantMeterModuleList",
+    "moduleSn",
+)
+
+
+class TopologyOutdated(Exception):
+    """A call of a plant failed because an identifier of the cached topology is outdated."""
+
+
+class TopologyCache(object):
+    """Keeps the discovery results of the plants of an account for a limited time.
+
+    The topology holds the getUserPlantList result and, by plant index, the
+    TOPOLOGY_STEPS results of every polled plant.
+    """
+
+    def __init__(self, ttl, store=None, fingerprint=None):
+        self._ttl         = ttl.total_seconds()
+        self._store       = store
+        self._fingerprint = fingerprint
+        self._topology    = None
+        self._updated     = 0.0
+
+    async def async_load(self):
+        """Load a persisted topology so a restart can skip discovery."""
+        if self._store is None:
+            return
+        stored = await self._store.async_load()
+        if not stored or stored.get("fingerprint") != self._fingerprint:
+            return
+        self._topology = stored["topology"]
+        self._updated  = stored["updated"]
+        _LOGGER.debug("Loaded topology of %s plants from storage", len(self._topology["plants"]))
+
+    def get(self):
+        """Return the cached topology, or None when discovery is needed."""
+        if self._topology is None or time.time() - self._updated > self._ttl:
+            return None
+        return self._topology
+
+    @staticmethod
+    def plant(topology, plant_id):
+        """Return the cached fetch plan results of one plant, a persisted topology may hold steps that are no longer cached."""
+        cached = topology["plants"].get(str(plant_id), {})
+        return {name: result for name, result in cached.items() if name in TOPOLOGY_STEPS}
+
+    async def async_update(self, plantInfo, plants):
+        """Remember the topology discovered by a poll cycle, plants are fetch results by plant index."""
+        topology = {
+            "getUserPlantList": plantInfo,
+            "plants": {
+                str(plant_id): {name: results[name] for name in TOPOLOGY_STEPS if name in results}
+                for plant_id, results in plants.items()
+            },
+        }
+        self._topology = topology
+        self._updated  = time.time()
+        if self._store is not None:
+            await self._store.async_save(
+                {"fingerprint": self._fingerprint, "updated": self._updated, "topology": topology}
+            )
+
+    def invalidate(self):
+        """Forget the topology, e.g. when a call failed because of a stale identifier."""
+        self._topology = None
@@ -0,0 +1,13 @@
+"""
+Tests of the SAJ eSolar component, run from the repository root with python -m pytest.
+The modules that import Home Assistant are skipped when it is not installed.
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, ROOT)
+# the mock portal and the mock Modbus server of the benchmarks
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
@@ -0,0 +1,125 @@
+"""Tests of the statistics backfill: resuming a stopped run and a cumulative sum that never goes down.
+
+The recorder is replaced by an in-memory table of the imported statistics.
+"""
+
+import asyncio
+import datetime
+
+import pytest
+
+pytest.importorskip("homeassistant")
+
+from custom_components.saj_esolar import backfill  # noqa: E402
+from custom_components.saj_esolar.backfill import RESOLUTION_DAY, StatisticsBackfill  # noqa: E402
+from custom_components.saj_esolar.session import EsolarError  # noqa: E402
+
+
+class MemoryStore(object):
+    stored = {}
+
+    def __init__(self, hass, version, key):
+        self._key = key
+
+    async def async_load(self):
+        return self.stored.get(self._key)
+
+    async def async_save(self, data):
+        self.stored[self._key] = dict(data)
+
+
+class MemoryRecorder(object):
+    def __init__(self):
+        self.rows = {}
+
+    async def async_block_till_done(self):
+        pass
+
+    async def async_add_executor_job(self, target, *args):
+        return target(*args)
+
+    def add(self, hass, metadata, statistics):
+        for statistic in statistics:
+            start = statistic["start"].timestamp()
+            self.rows[start] = {"start": start, "state": statistic["state"], "sum": statistic["sum"]}
+
+    def last(self, hass, number, statistic_id, convert_units, types):
+        rows = [self.rows[start] for start in sorted(self.rows, reverse=True)[:number]]
+        return {statistic_id: rows} if rows else {}
+
+    def during(self, hass, start_time, end_time, statistic_ids, period, units, types):
+        rows = [
+            self.rows[start] for start in sorted(self.rows)
+            if start >= start_time.timestamp() and (end_time is None or start < end_time.timestamp())
+        ]
+        return {statistic_id: rows for statistic_id in statistic_ids} if rows else {}
+
+    def sums(self):
+        return [self.rows[start]["sum"] for start in sorted(self.rows)]
+
+
+class Charts(object):
+    """Month charts of 1 kWh per day, the periods in fail raise once."""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.fetched = []
+
+    async def async_get_plant_chart(self, plantuid, chartDateType, period):
+        self.fetched.append(period)
+        if period in self.fail:
+            self.fail.discard(period)
+            raise EsolarError("getPlantDetailChart2 returned 502")
+        return {"xAxis": [], "dataCountList": [[1] * 31]}
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    recorder = MemoryRecorder()
+    MemoryStore.stored = {}
+    monkeypatch.setattr(backfill, "Store", MemoryStore)
+    monkeypatch.setattr(backfill, "get_instance", lambda hass: recorder)
+    monkeypatch.setattr(backfill, "async_add_external_statistics", recorder.add)
+    monkeypatch.setattr(backfill, "get_last_statistics", recorder.last)
+    monkeypatch.setattr(backfill, "statistics_during_period", recorder.during)
+    return recorder
+
+
+def test_separate_ranges_add_up(recorder):
+    job = StatisticsBackfill(object(), Charts(), "plant-1")
+    asyncio.run(job.async_run(datetime.date(2024, 1, 1), datetime.date(2024, 1, 31), RESOLUTION_DAY))
+    asyncio.run(job.async_run(datetime.date(2024, 2, 1), datetime.date(2024, 2, 10), RESOLUTION_DAY))
+    assert recorder.sums() == [float(day) for day in range(1, 42)]
+
+    # an earlier range shifts the sums imported after it
+    asyncio.run(job.async_run(datetime.date(2023, 12, 1), datetime.date(2023, 12, 31), RESOLUTION_DAY))
+    assert recorder.sums() == [float(day) for day in range(1, 73)]
+
+
+def test_stopped_run_resumes_without_an_end(recorder, monkeypatch):
+    monkeypatch.setattr(backfill, "BACKFILL_BATCH", 1)
+    charts = Charts(fail=[datetime.date(2024, 3, 1)])
+    job = StatisticsBackfill(object(), charts, "plant-1")
+    asyncio.run(job.async_run(datetime.date(2024, 1, 1), datetime.date(2024, 6, 30), RESOLUTION_DAY))
+    assert len(recorder.rows) == 31 + 29
+    assert MemoryStore.stored[f"{backfill.DOMAIN}.backfill.plant_1"]["imported"] == "2024-02-29"
+
+    charts.fetched.clear()
+    asyncio.run(job.async_run(datetime.date(2024, 1, 1), None, RESOLUTION_DAY))
+    assert charts.fetched[0] == datetime.date(2024, 3, 1)
+    sums = recorder.sums()
+    assert sums == [float(day) for day in range(1, len(sums) + 1)]
+    yesterday = datetime.date.today() - datetime.timedelta(days=1)
+    assert MemoryStore.stored[f"{backfill.DOMAIN}.backfill.plant_1"]["imported"] == yesterday.isoformat()
+
+
+def test_restart_imports_again(recorder):
+    charts = Charts()
+    job = StatisticsBackfill(object(), charts, "plant-1")
+    asyncio.run(job.async_run(datetime.date(2024, 1, 1), datetime.date(2024, 1, 31), RESOLUTION_DAY))
+    asyncio.run(job.async_run(datetime.date(2024, 1, 1), datetime.date(2024, 1, 31), RESOLUTION_DAY))
+    assert charts.fetched == [datetime.date(2024, 1, 1)]
+
+    asyncio.run(job.async_run(datetime.date(2024, 1, 1), datetime.date(2024, 1, 31), RESOLUTION_DAY, restart=True))
+    assert charts.fetched == [datetime.date(2024, 1, 1)] * 2
+    assert recorder.sums() == [float(day) for day in range(1, 32)]
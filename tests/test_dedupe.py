@@ -0,0 +1,43 @@
+"""Tests of the request keys and the single flight request cache of a poll cycle."""
+
+import asyncio
+
+from custom_components.saj_esolar.dedupe import IGNORED_PARAMS, RequestCache, request_key
+
+
+def test_key_ignores_the_cache_buster_and_empty_parameters():
+    assert "_" in IGNORED_PARAMS[None]
+    first = request_key("getPlantMeterChartData", "https://portal/getPlantMeterChartData?plantuid=1&moduleSn=M&_=1700000000000")
+    second = request_key("getPlantMeterChartData", "https://portal/getPlantMeterChartData?moduleSn=M&plantuid=1&deviceSnArr=&_=1700000000999")
+    assert first == second == ("getPlantMeterChartData", (("moduleSn", "M"), ("plantuid", "1")))
+
+
+def test_key_of_form_and_dict_data():
+    form = request_key("getPlantDetailInfo", "https://portal/getPlantDetailInfo", "plantuid=1&clientDate=2024-06-01")
+    mapping = request_key("getPlantDetailInfo", "https://portal/getPlantDetailInfo", {"clientDate": "2024-06-01", "plantuid": 1})
+    assert form == mapping
+
+
+def test_key_keeps_the_office_and_dates_of_the_device_list():
+    url = "https://portal/cloudMonitor/device/findDevicePageList"
+    plain = request_key("findDevicePageList", url, "officeId=&plantuid=1&localDate=&localMonth=")
+    monthly = request_key("findDevicePageList", url, "officeId=1&plantuid=1&localDate=2024-06&localMonth=2024-06")
+    assert plain != monthly
+
+
+def test_cache_fetches_a_request_once():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"status": "success"}
+
+    async def run():
+        cache = RequestCache()
+        key = ("getPlantDetailInfo", (("plantuid", "1"),))
+        return await asyncio.gather(cache.async_fetch(key, fetch), cache.async_fetch(key, fetch), cache.async_fetch(("other", ()), fetch))
+
+    first, second, other = asyncio.run(run())
+    assert first is second
+    assert len(calls) == 2
@@ -0,0 +1,63 @@
+"""Tests of the register decoding and the Modbus-TCP client against the mock inverter."""
+
+import asyncio
+
+import pytest
+
+from custom_components.saj_esolar.modbus import MAX_GAP, MAX_REGISTERS, ModbusClient, ModbusError, Register, register_blocks
+
+from mock_modbus import MockModbus
+
+
+def test_decode_scales_signed_and_unsigned_values():
+    assert Register(0x40A5, "int16").decode([(-640) & 0xFFFF]) == -640
+    assert Register(0x406B, "uint16", 0.01).decode([7600]) == pytest.approx(76.0)
+    assert Register(0x4000, "int32").decode([0xFFFF, 0xFFFE]) == -2
+    assert Register(0x4000, "uint32", 0.1).decode([0x0001, 0x0000]) == pytest.approx(6553.6)
+
+
+def test_blocks_merge_close_registers():
+    registers = [Register(0x4098), Register(0x40A1), Register(0x40A5, "int32"), Register(0x406B)]
+    assert register_blocks(registers) == [(0x406B, 1), (0x4098, 0x40A7 - 0x4098)]
+
+
+def test_blocks_split_on_gaps_and_size():
+    assert register_blocks([Register(0), Register(MAX_GAP + 2)]) == [(0, 1), (MAX_GAP + 2, 1)]
+    spread = [Register(address) for address in range(0, 2 * MAX_REGISTERS, MAX_GAP)]
+    assert all(count <= MAX_REGISTERS for start, count in register_blocks(spread))
+
+
+def test_client_reads_the_registers_of_the_mock():
+    async def run():
+        mock = MockModbus()
+        server = await mock.async_start()
+        client = ModbusClient("127.0.0.1", server.sockets[0].getsockname()[1], timeout=1.0)
+        try:
+            words = await client.async_read_registers(0x40A5, 1)
+            mock.set(0x40A5, 123)
+            again = await client.async_read_registers(0x40A5, 1)
+        finally:
+            await client.async_close()
+            server.close()
+            await server.wait_closed()
+        return words, again, mock.requests
+
+    words, again, requests = asyncio.run(run())
+    assert Register(0x40A5).decode(words) == -640
+    assert again == [123]
+    assert requests == 2
+
+
+def test_client_raises_the_exception_of_the_device():
+    async def run():
+        server = await MockModbus(strict=True).async_start()
+        client = ModbusClient("127.0.0.1", server.sockets[0].getsockname()[1], timeout=1.0)
+        try:
+            await client.async_read_registers(0x5000, 2)
+        finally:
+            await client.async_close()
+            server.close()
+            await server.wait_closed()
+
+    with pytest.raises(ModbusError):
+        asyncio.run(run())
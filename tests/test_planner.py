@@ -0,0 +1,107 @@
+"""Tests of the fetch planner: dependency order, partial errors and the poll deadline."""
+
+import asyncio
+
+import pytest
+
+from custom_components.saj_esolar.planner import TIER_SLOW, FetchPlanner, FetchStep
+
+
+def fetch_of(value, delay=0.0, calls=None):
+    async def fetch(results):
+        if calls is not None:
+            calls.append(value)
+        await asyncio.sleep(delay)
+        return value
+    return fetch
+
+
+def failing(err):
+    async def fetch(results):
+        raise err
+    return fetch
+
+
+def test_requires_unknown_step():
+    with pytest.raises(ValueError):
+        FetchPlanner([FetchStep("b", ("a",), derive=lambda results: 1)])
+
+
+def test_steps_run_after_their_requirements():
+    planner = FetchPlanner([
+        FetchStep("sum", ("a", "b"), derive=lambda results: results["a"] + results["b"]),
+        FetchStep("a", fetch=fetch_of(1)),
+        FetchStep("b", ("a",), fetch=fetch_of(2)),
+    ])
+    assert asyncio.run(planner.async_run()) == {"a": 1, "b": 2, "sum": 3}
+
+
+def test_seeded_steps_are_not_fetched():
+    calls = []
+    planner = FetchPlanner([FetchStep("a", fetch=fetch_of(1, calls=calls)), FetchStep("b", fetch=fetch_of(2, calls=calls))])
+    assert asyncio.run(planner.async_run({"a": 5})) == {"a": 5, "b": 2}
+    assert calls == [2]
+
+
+def test_failing_step_fails_its_dependents_only():
+    err = KeyError("plantDetail")
+    planner = FetchPlanner([
+        FetchStep("a", fetch=failing(err)),
+        FetchStep("b", ("a",), derive=lambda results: results["a"]),
+        FetchStep("c", fetch=fetch_of(3)),
+    ])
+    errors = {}
+    results = asyncio.run(planner.async_run(errors=errors))
+    assert results == {"c": 3}
+    assert errors == {"a": err, "b": err}
+
+
+def test_failing_step_without_errors_raises():
+    planner = FetchPlanner([FetchStep("a", fetch=failing(KeyError("a"))), FetchStep("c", fetch=fetch_of(3))])
+    with pytest.raises(KeyError):
+        asyncio.run(planner.async_run())
+
+
+def test_deadline_keeps_the_finished_steps():
+    async def run():
+        planner = FetchPlanner([
+            FetchStep("fast", fetch=fetch_of(1)),
+            FetchStep("slow", fetch=fetch_of(2, delay=5.0)),
+            FetchStep("after", ("slow",), derive=lambda results: results["slow"]),
+        ])
+        errors = {}
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        results = await planner.async_run(deadline=started + 0.05, errors=errors)
+        return results, errors, loop.time() - started
+
+    results, errors, duration = asyncio.run(run())
+    assert duration < 1.0
+    assert results == {"fast": 1}
+    assert set(errors) == {"slow", "after"}
+    assert all(isinstance(err, asyncio.TimeoutError) for err in errors.values())
+
+
+def test_unchanged_results_keep_the_previous_objects():
+    previous = {"a": {"value": 1}, "b": [1]}
+    planner = FetchPlanner([
+        FetchStep("a", fetch=fetch_of({"value": 1})),
+        FetchStep("b", ("a",), derive=lambda results: [results["a"]["value"]]),
+    ])
+    results = asyncio.run(planner.async_run(previous=previous))
+    assert results["a"] is previous["a"]
+    assert results["b"] is previous["b"]
+    assert planner.unchanged(results, previous, ("a", "b"))
+
+
+def test_select_and_depends_on():
+    planner = FetchPlanner([
+        FetchStep("plantuid", derive=lambda results: "uid"),
+        FetchStep("chart", ("plantuid",), fetch=fetch_of(1), tier=TIER_SLOW),
+        FetchStep("curves", ("chart",), derive=lambda results: results["chart"]),
+        FetchStep("list", fetch=fetch_of(2)),
+    ])
+    assert planner.select(["curves"]) == {"curves", "chart", "plantuid"}
+    assert planner.depends_on("curves", ("plantuid",))
+    assert not planner.depends_on("list", ("plantuid",))
+    assert planner.origin("curves") == "chart"
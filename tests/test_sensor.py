@@ -0,0 +1,75 @@
+"""Tests of the poll cycles of the portal data source against the mock portal."""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("homeassistant")
+
+import aiohttp  # noqa: E402
+from aiohttp.test_utils import TestServer  # noqa: E402
+
+from custom_components.saj_esolar.sensor import EsolarProvider, SAJeSolarMeterData  # noqa: E402
+from custom_components.saj_esolar.session import EsolarSession  # noqa: E402
+
+from mock_portal import MockPortal  # noqa: E402
+
+
+def poll(portal, cycles, change=None):
+    """Poll the portal once to discover the plants, apply change to it and return its requests of the next cycles."""
+
+    async def run():
+        server = TestServer(portal.application())
+        await server.start_server()
+        provider = EsolarProvider(f"{server.host}:{server.port}", "saj", "http")
+        # the default cookie jar ignores cookies of IP address hosts like the mock portal
+        async with aiohttp.ClientSession(cookie_jar=aiohttp.CookieJar(unsafe=True)) as session:
+            data = SAJeSolarMeterData(EsolarSession(session, provider, "test@example.com", "secret"), portal.mode, 0, provider)
+            try:
+                await data.async_update()
+                if change is not None:
+                    change(portal)
+                requests = []
+                for _ in range(cycles):
+                    portal.requests.clear()
+                    snapshots = await data.async_update()
+                    requests.append(dict(portal.requests))
+                return snapshots, requests
+            finally:
+                await server.close()
+
+    return asyncio.run(run())
+
+
+def test_failing_endpoint_doesnt_rediscover():
+    portal = MockPortal("None")
+    del portal.fixtures["getPlantDetailChart2"]
+    snapshots, requests = poll(portal, 3)
+    assert snapshots["plant-none-0001"].detail is not None
+    for cycle in requests:
+        assert "getUserPlantList" not in cycle
+        assert cycle["getPlantDetailInfo"] == 1
+        # the failed slow step is fetched again, once
+        assert cycle["getPlantDetailChart2"] == 1
+
+
+def test_outdated_identifier_rediscovers_once():
+    portal = MockPortal("saj_sec")
+
+    def forget_module(portal):
+        # the answer of a module the portal doesn't know lacks the chart
+        portal.fixtures["getPlantMeterChartData"] = b'{"status": "success"}'
+
+    snapshots, requests = poll(portal, 3, forget_module)
+    assert requests[0]["getUserPlantList"] == 1
+    assert requests[0]["getPlantMeterModuleList"] == 1
+    for cycle in requests[1:]:
+        assert "getUserPlantList" not in cycle
+        assert "getPlantMeterModuleList" not in cycle
+        assert cycle["getPlantMeterChartData"] == 1
+
+
+def test_steady_poll_skips_discovery_and_the_slow_tier():
+    portal = MockPortal("h1")
+    snapshots, requests = poll(portal, 2)
+    assert requests[-1] == {"getPlantDetailInfo": 1, "findDevicePageList": 1, "getStoreOrAcDevicePowerInfo": 1}
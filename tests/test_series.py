@@ -0,0 +1,46 @@
+"""Tests of the compact chart series and the samples that are new since the previous poll."""
+
+import datetime
+
+import pytest
+
+pytest.importorskip("homeassistant")
+
+from custom_components.saj_esolar.series import ChartSeries  # noqa: E402
+
+DAY = datetime.date(2024, 6, 1)
+
+
+def chart(*values):
+    return {"xAxis": ["00:00", "00:05", "00:10", "00:15"][:len(values)], "dataCountList": [list(values)]}
+
+
+def test_from_chart_skips_samples_without_value():
+    series = ChartSeries.from_chart(chart("1.5", None, "", "4"), 0, DAY)
+    assert list(series.minutes) == [0, 15]
+    assert list(series.values) == [1.5, 4.0]
+    assert len(series) == 2
+
+
+def test_since_without_previous_returns_every_sample():
+    series = ChartSeries.from_chart(chart("1", "2"), 0, DAY)
+    samples = series.since(None)
+    assert [value for timestamp, value in samples] == [1.0, 2.0]
+    assert samples[1][0].time() == datetime.time(0, 5)
+    assert samples[1][0].tzinfo is not None
+
+
+def test_since_returns_new_and_changed_samples():
+    previous = ChartSeries.from_chart(chart("1", "2"), 0, DAY)
+    series = ChartSeries.from_chart(chart("1", "3", "4"), 0, DAY)
+    assert [(timestamp.time(), value) for timestamp, value in series.since(previous)] == [
+        (datetime.time(0, 5), 3.0),
+        (datetime.time(0, 10), 4.0),
+    ]
+    assert series.since(series) == []
+
+
+def test_since_a_series_of_another_day_returns_every_sample():
+    previous = ChartSeries.from_chart(chart("1", "2"), 0, DAY - datetime.timedelta(days=1))
+    series = ChartSeries.from_chart(chart("1", "2"), 0, DAY)
+    assert len(series.since(previous)) == 2
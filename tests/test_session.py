@@ -0,0 +1,101 @@
+"""Tests of the circuit breaker and the login of the portal session against the mock portal."""
+
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("homeassistant")
+
+import aiohttp  # noqa: E402
+from aiohttp.test_utils import TestServer  # noqa: E402
+
+from custom_components.saj_esolar.sensor import EsolarProvider  # noqa: E402
+from custom_components.saj_esolar.session import CircuitBreaker, EsolarAuthError, EsolarSession  # noqa: E402
+
+from mock_portal import MockPortal  # noqa: E402
+
+
+def test_breaker_opens_after_the_threshold():
+    breaker = CircuitBreaker(threshold=3, reset=60.0)
+    for _ in range(2):
+        breaker.record_failure()
+    assert not breaker.is_open
+    breaker.record_failure()
+    assert breaker.is_open
+    assert not asyncio.run(breaker.async_allow())
+    assert 0 < breaker.retry_in() <= 60.0
+
+
+def test_breaker_probe_closes_or_reopens(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(threshold=1, reset=60.0)
+    breaker.record_failure()
+    assert breaker.is_open
+
+    now[0] += 61.0
+    assert asyncio.run(breaker.async_allow())
+    assert breaker.half_open
+    # the failed probe opens the circuit for another reset
+    breaker.record_failure()
+    assert breaker.is_open and not breaker.half_open
+    assert breaker.retry_in() == 60.0
+
+    now[0] += 61.0
+    assert asyncio.run(breaker.async_allow())
+    breaker.record_success()
+    assert not breaker.is_open and not breaker.half_open
+    assert asyncio.run(breaker.async_allow())
+
+
+def test_breaker_requests_wait_for_the_probe():
+    async def run():
+        breaker = CircuitBreaker(threshold=1, reset=0.0)
+        breaker.record_failure()
+        assert await breaker.async_allow()
+        waiting = asyncio.ensure_future(breaker.async_allow())
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        breaker.record_success()
+        return await waiting
+
+    assert asyncio.run(run())
+
+
+async def async_session(portal, password):
+    server = TestServer(portal.application())
+    await server.start_server()
+    provider = EsolarProvider(f"{server.host}:{server.port}", "saj", "http")
+    # the default cookie jar ignores cookies of IP address hosts like the mock portal
+    session = aiohttp.ClientSession(cookie_jar=aiohttp.CookieJar(unsafe=True))
+    return server, session, EsolarSession(session, provider, "test@example.com", password)
+
+
+def test_login_keeps_the_session():
+    async def run():
+        portal = MockPortal()
+        server, session, esolar = await async_session(portal, "secret")
+        try:
+            url = f"{esolar._provider.getBaseUrl()}/monitor/site/getPlantDetailInfo"
+            await esolar.async_request("POST", url, data="plantuid=1")
+            await esolar.async_request("POST", url, data="plantuid=1")
+            return portal.logins, esolar.logged_in
+        finally:
+            await session.close()
+            await server.close()
+
+    assert asyncio.run(run()) == (1, True)
+
+
+def test_rejected_login_raises_an_auth_error():
+    async def run():
+        server, session, esolar = await async_session(MockPortal(), "")
+        try:
+            await esolar.async_login()
+        finally:
+            await session.close()
+            await server.close()
+
+    with pytest.raises(EsolarAuthError):
+        asyncio.run(run())